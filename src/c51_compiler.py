@@ -6,9 +6,44 @@ import subprocess
 import tempfile
 import shutil
 import re
+import functools
+import hashlib
+import locale
 from pathlib import Path
 
 
+# Characters that end a line, as recognised by str.splitlines()
+_EOL = r'\n\r\f\v\x1c-\x1e\x85\u2028\u2029'
+
+# Common assembly operations; a listing line mentioning one is treated as code
+_COMMON_OPS = frozenset({'MOV', 'ADD', 'SUB', 'MUL', 'DIV', 'JMP', 'CALL', 'RET', 'PUSH', 'POP'})
+_COMMON_OPS_ALT = '|'.join(sorted(_COMMON_OPS, key=lambda op: (-len(op), op)))
+
+# One pass over a Keil listing, one match per line that holds assembly code:
+# either "<line no> <address> <instruction>" or any line mentioning a common
+# operation (minus its leading line number). Header and summary lines are skipped.
+_LISTING_CODE_RE = re.compile(rf'''
+    (?<![^{_EOL}])                                  # start of a line
+    [^\S{_EOL}]*(?=\S)                              # leading whitespace of a non-blank line
+    (?!(?-i:;|MODULE|COMPILER|SUMMARY|FUNCTION|NAME))  # header and summary lines
+    (?:
+        \d+[^\S{_EOL}]+[0-9A-F]+[^\S{_EOL}]+(?P<instr>[A-Z][^{_EOL}]*)
+      | (?=[^{_EOL}]*?(?:{_COMMON_OPS_ALT}))
+        (?:\d+[^\S{_EOL}]+)?(?P<code>[^{_EOL}]*)
+    )
+''', re.IGNORECASE | re.VERBOSE)
+
+# Bump when extract_code_from_listing changes its output (part of the cache key)
+_EXTRACTOR_VERSION = 1
+
+
+# C51 directives passed on every compilation (also part of the cache key)
+_COMPILE_FLAGS = (
+    "DEBUG",  # Include debug info
+    "OPTIMIZE(9)",  # High optimization level
+)
+
+
 def compile_c_to_asm_keil(c_file_path, output_dir=None, keil_path=None):
     """
     Compile a C file to assembly using Keil C51 compiler.
@@ -48,23 +83,22 @@ def compile_c_to_asm_keil(c_file_path, output_dir=None, keil_path=None):
             c51_compiler,
             temp_c_path,
             f"OBJECT({os.path.splitext(c_filename)[0]}.obj)",
-            "DEBUG",  # Include debug info
-            "OPTIMIZE(9)",  # High optimization level
+            *_COMPILE_FLAGS,
             f"INCDIR({os.path.join(keil_path, 'INC')})"  # Include path
         ]
         
-        # Run the C51 compiler
+        # Run the C51 compiler; output is kept as bytes and only decoded on failure
         result = subprocess.run(
             cmd,
             capture_output=True,
-            text=True,
             timeout=30,  # 30-second timeout
             cwd=output_dir
         )
         
         if result.returncode != 0:
-            # Combine stdout and stderr for error message
-            output = result.stdout + "\n" + result.stderr
+            # Combine stdout and stderr for error message (C51 reports errors on stdout)
+            output = (result.stdout + b"\n" + result.stderr).decode(
+                locale.getpreferredencoding(False), errors='replace')
             error_msg = f"Compilation failed (Code {result.returncode}): {output.strip()}"
             return False, "", error_msg
         
@@ -97,9 +131,11 @@ def compile_c_to_asm_keil(c_file_path, output_dir=None, keil_path=None):
                 pass
 
 
+@functools.lru_cache(maxsize=1)
 def find_keil_c51():
     """
     Attempt to find Keil C51 installation on the system.
+    The result is cached; call find_keil_c51.cache_clear() after installing Keil.
     
     Returns:
         str or None: Path to Keil C51 installation, or None if not found
@@ -142,53 +178,136 @@ def extract_code_from_listing(asm_listing_content):
     if not asm_listing_content:
         return ""
     
-    lines = asm_listing_content.splitlines()
-    cleaned_lines = []
-    
-    # Pattern to match assembly code lines (typically have addresses followed by opcodes)
-    asm_pattern = re.compile(r'^\s*\d+\s+[0-9A-F]+\s+([A-Z]+.*$)', re.IGNORECASE)
+    return '\n'.join((match['instr'] or match['code']).rstrip()
+                     for match in _LISTING_CODE_RE.finditer(asm_listing_content))
+
+
+@functools.lru_cache(maxsize=None)
+def _file_digest(c_file_path, mtime_ns, size):
+    """SHA-1 of a file's bytes; mtime and size only serve as the memo key."""
+    with open(c_file_path, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+def _asm_cache_path(c_file_path, keil_path, cache_dir):
+    """
+    Location of the cached assembly for a C file, or None if caching is off,
+    the compiler is not installed or the file cannot be read.
+    """
+    # A cache hit stands in for a compiler run, so it needs the compiler
+    if not cache_dir or not keil_path or not os.path.exists(os.path.join(keil_path, "BIN", "C51.exe")):
+        return None
+    try:
+        st = os.stat(c_file_path)
+        digest = _file_digest(c_file_path, st.st_mtime_ns, st.st_size)
+    except OSError:
+        return None
     
-    for line in lines:
-        # Skip header lines and other non-assembly content
-        line = line.strip()
-        
-        # Skip if it looks like a header or summary line
-        if line.startswith(';') or line.startswith('MODULE') or line.startswith('COMPILER') or \
-           line.startswith('SUMMARY') or line.startswith('FUNCTION') or line.startswith('NAME'):
-            continue
-        
-        # Try to extract assembly instruction using pattern
-        match = asm_pattern.match(line)
-        if match:
-            asm_instruction = match.group(1).strip()
-            # Only add if it looks like an actual instruction
-            if asm_instruction and not asm_instruction.startswith('.'):
-                cleaned_lines.append(asm_instruction)
-        elif any(op in line.upper() for op in ['MOV', 'ADD', 'SUB', 'MUL', 'DIV', 'JMP', 'CALL', 'RET', 'PUSH', 'POP']):
-            # If it contains common assembly operations, consider it assembly code
-            # Remove any leading line numbers or addresses
-            clean_line = re.sub(r'^\s*\d+\s+', '', line)
-            if clean_line.strip():
-                cleaned_lines.append(clean_line.strip())
-    
-    return '\n'.join(cleaned_lines)
-
-
-def compile_and_extract_asm(c_file_path, keil_path=None):
+    # Same source compiled by another compiler, with other flags or extracted
+    # by an older version must not hit
+    key_parts = (digest, keil_path, str(_EXTRACTOR_VERSION), *_COMPILE_FLAGS)
+    key = hashlib.sha1("\0".join(key_parts).encode('utf-8')).hexdigest()
+    return os.path.join(cache_dir, key + ".lst")
+
+
+def _read_asm_cache(cache_path):
+    if cache_path and os.path.exists(cache_path):
+        try:
+            with open(cache_path, 'r', encoding='utf-8') as f:
+                return f.read()
+        except OSError:
+            pass
+    return None
+
+
+def _write_asm_cache(cache_path, cleaned_asm):
+    if not cache_path:
+        return
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        # Write to a temp name first so a concurrent reader never sees a partial file
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(cleaned_asm)
+        os.replace(tmp_path, cache_path)
+    except OSError:
+        pass
+
+
+def compile_and_extract_asm(c_file_path, keil_path=None, cache_dir=None):
     """
     Convenience function that compiles a C file to assembly and extracts clean assembly code.
+    If cache_dir is set, results are cached there by file content, so identical
+    sources are compiled once.
     
     Args:
         c_file_path (str): Path to the C source file
         keil_path (str, optional): Path to Keil C51 installation
+        cache_dir (str, optional): Directory for cached assembly. None disables caching
     
     Returns:
         tuple: (success: bool, asm_code: str, error_message: str)
     """
+    cache_path = _asm_cache_path(c_file_path, keil_path or find_keil_c51(), cache_dir)
+    cached = _read_asm_cache(cache_path)
+    if cached is not None:
+        return True, cached, ""
+    
     success, asm_content, error = compile_c_to_asm_keil(c_file_path, keil_path=keil_path)
     if not success:
         return False, "", error
     
     # Extract just the assembly code from the listing
     cleaned_asm = extract_code_from_listing(asm_content)
-    return True, cleaned_asm, ""
\ No newline at end of file
+    _write_asm_cache(cache_path, cleaned_asm)
+    return True, cleaned_asm, ""
+
+def compile_many(c_file_paths, keil_path=None, cache_dir=None):
+    """
+    Compile several C files to assembly and extract clean assembly code.
+    
+    The Keil installation is resolved once and all files share one output
+    directory, which is removed afterwards. C51 accepts a single source file
+    per invocation, so each file is still compiled by its own process.
+    
+    Args:
+        c_file_paths (list): Paths to the C source files
+        keil_path (str, optional): Path to Keil C51 installation
+        cache_dir (str, optional): Directory for cached assembly. None disables caching
+    
+    Returns:
+        list: One (success: bool, asm_code: str, error_message: str) tuple per file, in order
+    """
+    if not c_file_paths:
+        return []
+    
+    if not keil_path:
+        keil_path = find_keil_c51()
+        if not keil_path:
+            error = "Keil C51 compiler not found. Please provide keil_path parameter or install Keil C51."
+            return [(False, "", error) for _ in c_file_paths]
+    
+    output_dir = None
+    results = []
+    try:
+        for c_file_path in c_file_paths:
+            cache_path = _asm_cache_path(c_file_path, keil_path, cache_dir)
+            cached = _read_asm_cache(cache_path)
+            if cached is not None:
+                results.append((True, cached, ""))
+                continue
+            
+            if output_dir is None:
+                output_dir = tempfile.mkdtemp()
+            success, asm_content, error = compile_c_to_asm_keil(c_file_path, output_dir=output_dir, keil_path=keil_path)
+            if success:
+                cleaned_asm = extract_code_from_listing(asm_content)
+                _write_asm_cache(cache_path, cleaned_asm)
+                results.append((True, cleaned_asm, ""))
+            else:
+                results.append((False, "", error))
+    finally:
+        if output_dir is not None:
+            shutil.rmtree(output_dir, ignore_errors=True)
+    
+    return results
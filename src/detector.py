@@ -1,5 +1,15 @@
 """Detector utilities (moved to src root)."""
 import Levenshtein
+import numpy as np
+from collections import Counter
+
+try:
+    from rapidfuzz import process
+    from rapidfuzz.distance import Indel, LCSseq
+except ImportError:
+    process = None
+    Indel = None
+    LCSseq = None
 
 def tokenize_code(text):
     """
@@ -10,33 +20,74 @@ def tokenize_code(text):
         return []
     return text.split()
 
-def lcs_length(tokens1, tokens2):
+def tokenize_to_ids(text, vocab):
     """
-    Calculate Longest Common Subsequence length using dynamic programming.
+    Tokenize code and map each token to a small integer id.
     
     Args:
-        tokens1, tokens2: Lists of tokens to compare
+        text: Text to tokenize
+        vocab: Dict of token -> id, extended in place with unseen tokens.
+            Share one vocab across all texts that will be compared.
+    
+    Returns:
+        List of int token ids
+    """
+    return [vocab.setdefault(token, len(vocab)) for token in tokenize_code(text)]
+
+def lcs_bitparallel(tokens1, tokens2):
+    """
+    Longest Common Subsequence length with the bit-parallel algorithm of
+    Allison-Dix / Hyyrö, using Python ints as arbitrary-width bit vectors.
+    
+    Each token of the shorter sequence owns one bit, so the whole DP column
+    is updated with a few integer operations per token of the longer one.
+    Used when rapidfuzz is not installed.
+    
+    Args:
+        tokens1, tokens2: Sequences of hashable tokens
     
     Returns:
         Length of the longest common subsequence
     """
-    if not tokens1 or not tokens2:
+    if len(tokens1) > len(tokens2):
+        tokens1, tokens2 = tokens2, tokens1
+    if not tokens1:
         return 0
     
-    m, n = len(tokens1), len(tokens2)
+    # Bitmask of positions in the shorter sequence for each token
+    match_masks = {}
+    for i, token in enumerate(tokens1):
+        match_masks[token] = match_masks.get(token, 0) | (1 << i)
+    
+    mask = (1 << len(tokens1)) - 1
+    v = mask
+    for token in tokens2:
+        u = v & match_masks.get(token, 0)
+        v = ((v + u) | (v - u)) & mask
+    
+    # Every cleared bit is one matched position
+    return len(tokens1) - v.bit_count()
+
+def lcs_length(tokens1, tokens2):
+    """
+    Calculate Longest Common Subsequence length.
+    
+    Uses rapidfuzz's bit-parallel LCS (C++), which runs in O(m*n/64) time
+    and O(n/64) memory instead of building the full DP table. Falls back to
+    lcs_bitparallel when rapidfuzz is not installed.
     
-    # Create DP table
-    dp = [[0] * (n + 1) for _ in range(m + 1)]
+    Args:
+        tokens1, tokens2: Lists of tokens to compare
     
-    # Fill DP table
-    for i in range(1, m + 1):
-        for j in range(1, n + 1):
-            if tokens1[i-1] == tokens2[j-1]:
-                dp[i][j] = dp[i-1][j-1] + 1
-            else:
-                dp[i][j] = max(dp[i-1][j], dp[i][j-1])
+    Returns:
+        Length of the longest common subsequence
+    """
+    if not tokens1 or not tokens2:
+        return 0
     
-    return dp[m][n]
+    if LCSseq is None:
+        return lcs_bitparallel(tokens1, tokens2)
+    return LCSseq.similarity(tokens1, tokens2)
 
 def calculate_token_sequence_similarity(text1, text2):
     """
@@ -63,22 +114,30 @@ def calculate_token_sequence_similarity(text1, text2):
     if not tokens1 or not tokens2:
         return 0.0
     
-    lcs_len = lcs_length(tokens1, tokens2)
-    total_len = len(tokens1) + len(tokens2)
-    
-    return (2.0 * lcs_len) / total_len if total_len > 0 else 0.0
+    if Indel is None:
+        return 2 * lcs_length(tokens1, tokens2) / (len(tokens1) + len(tokens2))
+    # Indel normalized similarity is exactly 2 * LCS / (len1 + len2)
+    return Indel.normalized_similarity(tokens1, tokens2)
 
-def calculate_levenshtein_similarity(text1, text2):
+def calculate_levenshtein_similarity(text1, text2, score_cutoff=None):
     """
     Calculates similarity based on Levenshtein distance.
     Ratio = (len(text1) + len(text2) - distance) / (len(text1) + len(text2))
+    
+    If score_cutoff is given, ratios below it are returned as 0.0, which lets
+    the banded computation stop as soon as the cutoff is out of reach.
+    
+    The ratio is rapidfuzz's normalized Indel similarity, the same kernel the
+    pairwise matrices use, so single-pair and matrix scores agree exactly.
     """
     if not text1 and not text2:
         return 1.0
     if not text1 or not text2:
         return 0.0
         
-    return Levenshtein.ratio(text1, text2)
+    if Indel is None:
+        return Levenshtein.ratio(text1, text2, score_cutoff=score_cutoff)
+    return Indel.normalized_similarity(text1, text2, score_cutoff=score_cutoff)
 
 def calculate_combined_similarity(text1, text2):
     """
@@ -90,3 +149,120 @@ def calculate_combined_similarity(text1, text2):
         'token_seq': calculate_token_sequence_similarity(text1, text2),
         'levenshtein': calculate_levenshtein_similarity(text1, text2)
     }
+
+def pairwise_token_sequence_similarity(texts, workers=-1, score_cutoff=None, rows=None):
+    """
+    Token Sequence Similarity for every pair of texts at once.
+    
+    The full NxN matrix is computed by rapidfuzz.process.cdist in C++
+    (multi-threaded, GIL released), avoiding Python-level dispatch per pair.
+    
+    Args:
+        texts: List of texts to compare
+        workers: Number of threads, -1 uses all cores
+        score_cutoff: Scores below this value are returned as 0.0; rapidfuzz
+            rejects such pairs from their lengths or aborts the DP early
+        rows: Optional indices of the texts to compare against all texts;
+            by default every text is compared
+    
+    Returns:
+        numpy.ndarray of shape (len(texts), len(texts)), or (len(rows), len(texts))
+        if rows is given; entry [i][j] equals
+        calculate_token_sequence_similarity(texts[i], texts[j]) for non-empty texts
+    """
+    unique_texts, index = _unique(texts)
+    # Integer ids compare directly in the LCS kernel, strings are hashed first
+    vocab = {}
+    token_lists = [tokenize_to_ids(text, vocab) for text in unique_texts]
+    queries, query_index = _queries(token_lists, index, rows)
+    if process is None:
+        matrix = _pairwise_fallback(queries, token_lists, _token_ids_similarity, score_cutoff)
+    else:
+        matrix = process.cdist(queries, token_lists, scorer=Indel.normalized_similarity,
+                               dtype=np.float64, workers=workers, score_cutoff=score_cutoff)
+    return matrix[np.ix_(query_index, index)]
+
+def pairwise_levenshtein_similarity(texts, workers=-1, score_cutoff=None, rows=None):
+    """
+    Levenshtein ratio for every pair of texts at once.
+    
+    Levenshtein.ratio is the normalized Indel similarity, so the matrix is
+    computed with the same scorer through rapidfuzz.process.cdist.
+    
+    Args:
+        texts: List of texts to compare
+        workers: Number of threads, -1 uses all cores
+        score_cutoff: Scores below this value are returned as 0.0
+        rows: Optional indices of the texts to compare against all texts
+    
+    Returns:
+        numpy.ndarray of shape (len(texts), len(texts)), or (len(rows), len(texts))
+        if rows is given; entry [i][j] equals
+        calculate_levenshtein_similarity(texts[i], texts[j]) for non-empty texts
+    """
+    unique_texts, index = _unique(texts)
+    queries, query_index = _queries(unique_texts, index, rows)
+    if process is None:
+        matrix = _pairwise_fallback(queries, unique_texts, calculate_levenshtein_similarity, score_cutoff)
+    else:
+        matrix = process.cdist(queries, unique_texts, scorer=Indel.normalized_similarity,
+                               dtype=np.float64, workers=workers, score_cutoff=score_cutoff)
+    return matrix[np.ix_(query_index, index)]
+
+def _unique(texts):
+    """
+    Distinct texts in first-seen order, and each text's index into them.
+    Identical submissions (shared starter code, empty files) are scored once.
+    """
+    positions = {}
+    index = np.array([positions.setdefault(text, len(positions)) for text in texts], dtype=np.intp)
+    return list(positions), index
+
+def _queries(choices, index, rows):
+    """
+    Distinct texts to score against all choices, and each result row's index
+    into them. Only the texts of the requested rows are scored.
+    """
+    if rows is None:
+        return choices, index
+    query_ids, query_index = np.unique(index[np.asarray(rows, dtype=np.intp)], return_inverse=True)
+    return [choices[k] for k in query_ids], query_index
+
+def _token_ids_similarity(ids1, ids2):
+    """
+    Token Sequence Similarity of two already tokenized sequences.
+    """
+    if not ids1 and not ids2:
+        return 1.0
+    if not ids1 or not ids2:
+        return 0.0
+    return 2 * lcs_length(ids1, ids2) / (len(ids1) + len(ids2))
+
+def _pairwise_fallback(queries, choices, scorer, score_cutoff):
+    """
+    Pure Python stand-in for process.cdist when rapidfuzz is not installed.
+    
+    With a score_cutoff, pairs whose Indel similarity provably stays below it
+    are skipped before running the scorer: the LCS is at most the shorter
+    length, and at most the number of shared elements counted with
+    multiplicity, so 2 * bound / (len1 + len2) caps the score.
+    """
+    matrix = np.zeros((len(queries), len(choices)), dtype=np.float64)
+    if score_cutoff is not None:
+        choice_counts = [Counter(choice) for choice in choices]
+    for i, query in enumerate(queries):
+        if score_cutoff is not None:
+            query_counts = Counter(query)
+        for j, choice in enumerate(choices):
+            if score_cutoff is not None and query and choice:
+                total = len(query) + len(choice)
+                if 2 * min(len(query), len(choice)) / total < score_cutoff:
+                    continue
+                shared = sum((query_counts & choice_counts[j]).values())
+                if 2 * shared / total < score_cutoff:
+                    continue
+            score = scorer(query, choice)
+            if score_cutoff is not None and score < score_cutoff:
+                score = 0.0
+            matrix[i, j] = score
+    return matrix
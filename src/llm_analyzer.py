@@ -1,11 +1,11 @@
 """LLM analyzer (moved to src root)."""
 import os
+import json
+import threading
 
-def get_llm_prompt(code1, code2):
-    """
-    Generates a prompt for the LLM to analyze two code snippets.
-    """
-    prompt = f"""
+# Prompt for comparing two snippets; {0} and {1} are the codes, braces of the
+# JSON example are doubled for str.format
+_PROMPT_TEMPLATE = """
 You are an expert code plagiarism detector for 8051 assembly and C.
 Compare the following two code snippets and determine if they are plagiarized.
 The codes are implemented for the same project, thus it is acceptable for algorithms to be very very similar, as long as some part of logic is different.
@@ -14,12 +14,12 @@ Focus on logic, use of registers, control flow, and algorithm structure.
 
 左部分:
 ```
-{code1}
+{0}
 ```
 
 右部分:
 ```
-{code2}
+{1}
 ```
 
 Analyze the similarities and differences.
@@ -30,21 +30,37 @@ Conclude with a JSON object in the following format:
 }}
 
 Use Traditional Chinese to respond.
-"""
-    return prompt.strip()
+""".strip()
 
-import json
-import re
-
-import json
-import re
-import os
+def get_llm_prompt(code1, code2):
+    """
+    Generates a prompt for the LLM to analyze two code snippets.
+    """
+    return _PROMPT_TEMPLATE.format(code1, code2)
 
 try:
     import google.generativeai as genai
 except ImportError:
     genai = None
 
+# One configured model shared by all threads; rebuilt only if the API key changes
+_model = None
+_model_api_key = None
+_model_lock = threading.Lock()
+
+
+def _get_model(api_key):
+    """
+    Returns the shared Gemini model, configuring the client on first use.
+    """
+    global _model, _model_api_key
+    with _model_lock:
+        if _model is None or _model_api_key != api_key:
+            genai.configure(api_key=api_key)
+            _model = genai.GenerativeModel('gemini-2.5-flash-lite') # Use a fast and capable model
+            _model_api_key = api_key
+        return _model
+
 def analyze_pair_with_llm(code1, code2, api_key=None):
     """
     Sends the code pair to an LLM for analysis using Google Gemini API.
@@ -66,8 +82,7 @@ def analyze_pair_with_llm(code1, code2, api_key=None):
         }
 
     try:
-        genai.configure(api_key=api_key)
-        model = genai.GenerativeModel('gemini-2.5-flash-lite') # Use a fast and capable model
+        model = _get_model(api_key)
         
         prompt = get_llm_prompt(code1, code2)
         # Force JSON format in prompt if not already clear, though the prompt function does it.
@@ -76,23 +91,20 @@ def analyze_pair_with_llm(code1, code2, api_key=None):
         response = model.generate_content(prompt)
         content = response.text
         
-        # Parse JSON response
-        try:
-            # Clean up markdown code blocks if present
-            content = content.replace('```json', '').replace('```', '')
-            result = json.loads(content)
-            return result
-        except json.JSONDecodeError:
-            # Fallback if not valid JSON (try to extract json block)
-            match = re.search(r'\{.*\}', content, re.DOTALL)
-            if match:
-                return json.loads(match.group(0))
-            else:
-                return {
-                    "is_plagiarized": False,
-                    "confidence_score": 0.0,
-                    "reasoning": f"Failed to parse LLM response: {content[:100]}..."
-                }
+        # Parse JSON response: take the outermost {...}, which also skips
+        # any markdown code fence around it
+        start = content.find('{')
+        end = content.rfind('}')
+        if start >= 0 and end > start:
+            try:
+                return json.loads(content[start:end + 1])
+            except json.JSONDecodeError:
+                pass
+        return {
+            "is_plagiarized": False,
+            "confidence_score": 0.0,
+            "reasoning": f"Failed to parse LLM response: {content[:100]}..."
+        }
                 
     except Exception as e:
         return {
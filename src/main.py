@@ -1,192 +1,321 @@
 import os
+import statistics
+import sys
 import itertools
+import concurrent.futures
+import numpy as np
 from tqdm import tqdm
 from preprocessor import crawl_directory, clean_code, normalize_hex, validate_source_code, check_hex_integrity
-from detector import calculate_combined_similarity, calculate_levenshtein_similarity
+from detector import (calculate_combined_similarity, calculate_levenshtein_similarity,
+                      pairwise_token_sequence_similarity, pairwise_levenshtein_similarity)
 from llm_analyzer import analyze_pair_with_llm
 from reporter import generate_html_report
-from c51_compiler import compile_and_extract_asm, find_keil_c51
+from c51_compiler import compile_many, find_keil_c51
+from result_cache import ResultCache, content_hash, files_hash
+
+# LLM requests are network-bound, so several can be in flight at once
+LLM_MAX_WORKERS = 8
 
 
 def read_file_with_encoding(file_path):
     """
     Try to read file with UTF-8, then CP950 (Big5).
+    The file is read once; each encoding is tried on the same bytes.
+    """
+    try:
+        with open(file_path, 'rb') as f:
+            data = f.read()
+    except Exception as e:
+        print(f"Error reading {file_path}: {e}")
+        return ""
+    
+    if data.isascii():
+        text = data.decode('ascii')
+    else:
+        # utf-8-sig also drops a leading BOM; latin-1 always succeeds
+        for enc in ['utf-8-sig', 'cp950', 'latin-1']:
+            try:
+                text = data.decode(enc)
+                break
+            except UnicodeDecodeError:
+                continue
+    
+    # Same newline handling as reading in text mode
+    return text.replace('\r\n', '\n').replace('\r', '\n')
+
+def process_student(student, files, use_keil_compilation=False, keil_path=None, asm_cache_dir=None):
     """
-    encodings = ['utf-8', 'cp950', 'latin-1']
-    for enc in encodings:
+    Reads, cleans and validates one student's submission.
+    Returns the student's data dict used by check_plagiarism.
+    If asm_cache_dir is set, compiled assembly is cached there.
+    """
+    data = {
+        'source': "", 
+        'hex': "", 
+        'original_source': "", 
+        'asm_source': "",         # Compiled assembly or raw assembly
+        'illegal_submission': False, 
+        'illegal_reason': "",
+        'hex_anomalies': [],      # List of hex anomalies
+        'source_anomalies': [],   # List of source code anomalies
+        'has_anomaly': False,     # Flag for any anomaly
+        'hex_length': 0,          # Hex data length
+        'hex_info': {}            # Hex validation info
+    }
+    
+    # Check for illegal submission (no valid source files or no hex files)
+    # Determine valid extensions based on configuration
+    valid_extensions = ['.a51', '.asm', '.c']
+    # if use_keil_compilation:
+    #     valid_extensions.append('.c')
+        
+    has_valid_source = False
+    for src_file in files['source']:
+        ext = os.path.splitext(src_file)[1].lower()
+        if ext in valid_extensions:
+            has_valid_source = True
+            break
+            
+    if not has_valid_source:
+        data['illegal_submission'] = True
+        if files['all_files']:
+            # Found files but not valid source
+            exts = set([os.path.splitext(f)[1] for f in files['all_files']])
+            data['illegal_reason'] = f"無效提交：找到 {', '.join(exts)} 檔案，但需要 (C 或 A51) 檔案"
+        else:
+            data['illegal_reason'] = "未找到任何檔案"
+    
+    # Combine all source files (parts are joined once at the end)
+    source_parts = []
+    asm_source_parts = []  # For compiled assembly from C files
+    original_source_parts = []
+    
+    c_files_for_compilation = []  # Track C files to compile if needed
+    asm_files_cleaned = []  # Cleaned regular assembly files, reused for asm_source
+
+    for src_file in files['source']:
+        try:
+            content = read_file_with_encoding(src_file)
+            if not content:
+                print(f"Warning: Could not read {src_file} or file is empty")
+                continue
+                
+            ext = os.path.splitext(src_file)[1].lower()  # Lowercase for case-insensitive comparison
+            
+            # Store original content with filename header for display
+            filename = os.path.basename(src_file)
+            original_source_parts.append(f"--- {filename} ---\n{content}\n\n")
+            
+            if ext in ['.c']:
+                cleaned = clean_code(content, ext)
+                source_parts.append(cleaned)
+                if use_keil_compilation:
+                    c_files_for_compilation.append(src_file)
+            elif ext in ['.a51', '.asm']:
+                cleaned = clean_code(content, ext)
+                source_parts.append(cleaned)
+                asm_files_cleaned.append(cleaned)
+            
+            # Validate source code quality
+            anomalies = validate_source_code(content, ext)
+            data['source_anomalies'].extend(anomalies)
+        except Exception as e:
+            print(f"Error reading {src_file}: {e}")      
+
+    # If we need to compile C to assembly
+    if use_keil_compilation and c_files_for_compilation:
+        print(f"Compiling C files to assembly for student {student}...")
+        compiled = compile_many(c_files_for_compilation, keil_path, cache_dir=asm_cache_dir)
+        for c_file, (success, asm_code, error) in zip(c_files_for_compilation, compiled):
+            if success:
+                asm_source_parts.append(asm_code)
+                # print(f"  Successfully compiled {c_file} to assembly")
+            else:
+                print(f"  Failed to compile {c_file}: {error}")
+
+    # Add regular assembly files to asm_source as well
+    # (.a51 and .asm are cleaned identically, so the result above is reused)
+    asm_source_parts.extend(asm_files_cleaned)
+
+    data['source'] = " ".join(source_parts).strip()
+    data['asm_source'] = " ".join(asm_source_parts).strip()
+    data['original_source'] = "".join(original_source_parts).strip()
+    
+    # Combine all hex files and collect validation info
+    hex_parts = []
+    all_hex_info = {
+        'has_eof': False,
+        'format_errors': [],
+        'valid_lines': 0,
+        'data_length': 0
+    }
+    
+    for hex_file in files['hex']:
         try:
-            with open(file_path, 'r', encoding=enc) as f:
-                return f.read()
-        except UnicodeDecodeError:
-            continue
+            # Intel HEX is ASCII, parse the raw bytes without decoding
+            with open(hex_file, 'rb') as f:
+                content = f.read()
+            if not content:
+                continue
+                
+            hex_data, hex_info = normalize_hex(content)
+            hex_parts.append(hex_data)
+            
+            # Aggregate hex info
+            if hex_info['has_eof']:
+                all_hex_info['has_eof'] = True
+            all_hex_info['format_errors'].extend(hex_info['format_errors'])
+            all_hex_info['valid_lines'] += hex_info['valid_lines']
+
         except Exception as e:
-            print(f"Error reading {file_path} with {enc}: {e}")
-            return ""
-    return ""
+            print(f"Error reading {hex_file}: {e}")
+
+    full_hex = "".join(hex_parts)
+    data['hex'] = full_hex
+    data['hex_length'] = len(full_hex)
+    all_hex_info['data_length'] = len(full_hex)
+    data['hex_info'] = all_hex_info
+    
+
+    # Check if hex is empty (illegal submission - not anomaly)
+    if not full_hex or full_hex.strip() == "":
+        data['illegal_submission'] = True
+        if data['illegal_reason']:
+            data['illegal_reason'] += " | 未找到有效的 hex 檔案"
+        else:
+            data['illegal_reason'] = "無效提交：未找到有效的 hex 檔案"
+
+    # Digests of the compared texts, used as keys in the result cache
+    data['content_hashes'] = {key: content_hash(data[key]) for key in ('source', 'asm_source', 'hex')}
+
+    return data
+
+
+def cached_pairwise_similarity(cache, metric, texts, hashes, pairwise_fn, score_cutoff=None):
+    """
+    Pairwise similarity matrix that reuses rows cached by earlier runs.
+    hashes[i] is the content digest of texts[i].
+    
+    The cache holds one row per distinct text: its scores against every text
+    it was compared with, where scores below score_cutoff are stored as 0.0.
+    Only texts without a cached row (new or changed submissions) are scored
+    again; when that is most of them, the full matrix is computed at once.
+    """
+    n = len(texts)
+    known = {}
+    for text_hash in set(hashes):
+        row = cache.get_row(metric, score_cutoff, text_hash)
+        if row is not None:
+            known[text_hash] = row
+    
+    # Rows cached by runs over different submissions may not cover each
+    # other; for a pair missing from both rows, one of them is scored again
+    stale = set()
+    for text_hash, row in known.items():
+        uncovered = known.keys() - row.keys() - stale
+        if any(text_hash not in known[other] for other in uncovered):
+            stale.add(text_hash)
+    rows = [i for i, text_hash in enumerate(hashes) if text_hash not in known or text_hash in stale]
+    
+    # When most rows are needed anyway, the full matrix is computed in one pass
+    if len(rows) * 2 > n:
+        rows = list(range(n))
+        computed = pairwise_fn(texts, score_cutoff=score_cutoff)
+    elif rows:
+        computed = pairwise_fn(texts, score_cutoff=score_cutoff, rows=rows)
+    
+    # Cached pairs may be recorded in either student's row only
+    matrix = np.full((n, n), -1.0, dtype=np.float64)
+    recomputed = set(rows)
+    for i, text_hash in enumerate(hashes):
+        if i not in recomputed:
+            row = known[text_hash]
+            matrix[i] = [row.get(other, -1.0) for other in hashes]
+    matrix = np.maximum(matrix, matrix.T)
+    
+    if rows:
+        matrix[rows, :] = computed
+        matrix[:, rows] = computed.T
+        stored = set()
+        for k, i in enumerate(rows):
+            if hashes[i] not in stored:
+                stored.add(hashes[i])
+                cache.put_row(metric, score_cutoff, hashes[i], dict(zip(hashes, computed[k].tolist())))
+    
+    return matrix
+
 
 def check_plagiarism(root_path, filter_mode="threshold", 
                     hex_threshold=0.7, src_threshold=0.8, 
                     top_metric="avg_score", top_percent=0.05,
-                    lab_name="Lab", use_keil_compilation=False, keil_path=None):
+                    lab_name="Lab", use_keil_compilation=False, keil_path=None,
+                    cache_dir=None, gzip_report=False):
 
     """
     Main function to check plagiarism.
+    If cache_dir is set, preprocessing, compilation and similarity results are
+    stored there and reused by later runs for unchanged files.
+    If gzip_report is set, a .html.gz copy of the report is written as well.
     """
+    cache = ResultCache(cache_dir) if cache_dir else None
+    asm_cache_dir = os.path.join(cache_dir, 'asm') if cache_dir else None
+    try:
+        return _check_plagiarism(root_path, filter_mode, hex_threshold, src_threshold,
+                                 top_metric, top_percent, lab_name,
+                                 use_keil_compilation, keil_path, cache, asm_cache_dir, gzip_report)
+    finally:
+        if cache:
+            cache.close()
+
+
+def _check_plagiarism(root_path, filter_mode, hex_threshold, src_threshold,
+                      top_metric, top_percent, lab_name,
+                      use_keil_compilation, keil_path, cache, asm_cache_dir, gzip_report):
     print("Step 1: Crawling and preprocessing...")
     student_files = crawl_directory(root_path)
     student_data = {}
+    students = list(student_files.keys())
 
-    # Preprocess all data
-    for student, files in student_files.items():
-        student_data[student] = {
-            'source': "", 
-            'hex': "", 
-            'original_source': "", 
-            'asm_source': "",         # Compiled assembly or raw assembly
-            'illegal_submission': False, 
-            'illegal_reason': "",
-            'hex_anomalies': [],      # List of hex anomalies
-            'source_anomalies': [],   # List of source code anomalies
-            'has_anomaly': False,     # Flag for any anomaly
-            'hex_length': 0,          # Hex data length
-            'hex_info': {}            # Hex validation info
-        }
-        
-        # Check for illegal submission (no valid source files or no hex files)
-        # Determine valid extensions based on configuration
-        valid_extensions = ['.a51', '.asm', '.c']
-        # if use_keil_compilation:
-        #     valid_extensions.append('.c')
-            
-        has_valid_source = False
-        for src_file in files['source']:
-            ext = os.path.splitext(src_file)[1].lower()
-            if ext in valid_extensions:
-                has_valid_source = True
-                break
-                
-        if not has_valid_source:
-            student_data[student]['illegal_submission'] = True
-            if files['all_files']:
-                # Found files but not valid source
-                exts = set([os.path.splitext(f)[1] for f in files['all_files']])
-                student_data[student]['illegal_reason'] = f"無效提交：找到 {', '.join(exts)} 檔案，但需要 (C 或 A51) 檔案"
-            else:
-                student_data[student]['illegal_reason'] = "未找到任何檔案"
-        
-        # Combine all source files
-        full_source = ""
-        full_asm_source = ""  # For compiled assembly from C files
-        full_original_source = ""
-        
-        c_files_for_compilation = []  # Track C files to compile if needed
-        asm_files_content = []  # Track regular assembly files
+    # Reuse preprocessing of students whose files are unchanged
+    student_keys = {}
+    if cache:
+        for student in students:
+            student_keys[student] = files_hash(student_files[student]['all_files'],
+                                               use_keil_compilation, keil_path or "")
+            cached = cache.get_student(student_keys[student])
+            if cached is not None:
+                student_data[student] = cached
+    pending = [student for student in students if student not in student_data]
 
-        for src_file in files['source']:
-            try:
-                content = read_file_with_encoding(src_file)
-                if not content:
-                    print(f"Warning: Could not read {src_file} or file is empty")
-                    continue
-                    
-                ext = os.path.splitext(src_file)[1].lower()  # Lowercase for case-insensitive comparison
-                
-                # Store original content with filename header for display
-                filename = os.path.basename(src_file)
-                full_original_source += f"--- {filename} ---\n{content}\n\n"  
-                
-                if ext in ['.c']:
-                    cleaned = clean_code(content, ext)
-                    full_source += cleaned + " "
-                    if use_keil_compilation:
-                        c_files_for_compilation.append(src_file)
-                elif ext in ['.a51', '.asm']:
-                    cleaned = clean_code(content, ext)
-                    full_source += cleaned + " "
-                    asm_files_content.append(content)
-                
-                # Validate source code quality
-                anomalies = validate_source_code(content, ext)
-                student_data[student]['source_anomalies'].extend(anomalies)
-            except Exception as e:
-                print(f"Error reading {src_file}: {e}")      
-
-        # If we need to compile C to assembly
-        if use_keil_compilation and c_files_for_compilation:
-            print(f"Compiling C files to assembly for student {student}...")
-            for c_file in c_files_for_compilation:
-                success, asm_code, error = compile_and_extract_asm(c_file, keil_path)
-                if success:
-                    full_asm_source += asm_code + " "
-                    # print(f"  Successfully compiled {c_file} to assembly")
-                else:
-                    print(f"  Failed to compile {c_file}: {error}")
-
-        # Add regular assembly files to asm_source as well
-        for asm_content in asm_files_content:
-            full_asm_source += clean_code(asm_content, '.a51') + " "
-
-        student_data[student]['source'] = full_source.strip()
-        student_data[student]['asm_source'] = full_asm_source.strip()
-        student_data[student]['original_source'] = full_original_source.strip()
-        
-        # Combine all hex files and collect validation info
-        full_hex = ""
-        all_hex_info = {
-            'has_eof': False,
-            'format_errors': [],
-            'valid_lines': 0,
-            'data_length': 0
-        }
-        
-        for hex_file in files['hex']:
-            try:
-                content = read_file_with_encoding(hex_file)
-                if not content:
-                    continue
-                    
-                hex_data, hex_info = normalize_hex(content)
-                full_hex += hex_data
-                
-                # Aggregate hex info
-                if hex_info['has_eof']:
-                    all_hex_info['has_eof'] = True
-                all_hex_info['format_errors'].extend(hex_info['format_errors'])
-                all_hex_info['valid_lines'] += hex_info['valid_lines']
-
-            except Exception as e:
-                print(f"Error reading {hex_file}: {e}")
-
-        student_data[student]['hex'] = full_hex
-        student_data[student]['hex_length'] = len(full_hex)
-        all_hex_info['data_length'] = len(full_hex)
-        student_data[student]['hex_info'] = all_hex_info
-        
+    # Preprocess all data; students are independent, so they run in parallel.
+    # Keil compilation is bound by the compiler subprocess, so threads suffice.
+    executor_cls = (concurrent.futures.ThreadPoolExecutor if use_keil_compilation
+                    else concurrent.futures.ProcessPoolExecutor)
+    with executor_cls() as executor:
+        processed = executor.map(process_student, pending,
+                                 [student_files[student] for student in pending],
+                                 itertools.repeat(use_keil_compilation), itertools.repeat(keil_path),
+                                 itertools.repeat(asm_cache_dir))
+        for student, data in tqdm(zip(pending, processed), total=len(pending),
+                                  desc="Preprocessing", unit="student"):
+            student_data[student] = data
+            if cache:
+                cache.put_student(student_keys[student], data)
 
-        # Check if hex is empty (illegal submission - not anomaly)
-        if not full_hex or full_hex.strip() == "":
-            student_data[student]['illegal_submission'] = True
-            if student_data[student]['illegal_reason']:
-                student_data[student]['illegal_reason'] += " | 未找到有效的 hex 檔案"
-            else:
-                student_data[student]['illegal_reason'] = "無效提交：未找到有效的 hex 檔案"
-        
+    # Keep crawl order
+    student_data = {student: student_data[student] for student in students}
+    for student, data in student_data.items():
+        # Identical submissions arrive as separate copies from the workers
+        # (or the cache); interning lets them share one string in memory
+        for key in ('source', 'asm_source', 'original_source', 'hex'):
+            data[key] = sys.intern(data[key])
         with open('debug.log', 'a', encoding='utf-8') as f:
-            f.write(f"DEBUG: Student {student} - Illegal: {student_data[student]['illegal_submission']}, Reason: {student_data[student]['illegal_reason']}\n")
-            f.write(f"DEBUG: Files: {files}\n")
-        
+            f.write(f"DEBUG: Student {student} - Illegal: {data['illegal_submission']}, Reason: {data['illegal_reason']}\n")
+            f.write(f"DEBUG: Files: {student_files[student]}\n")
     
     # Find median hex length across all students (excluding empty ones)
     hex_lengths = [data['hex_length'] for data in student_data.values() if data['hex_length'] > 0]
-    median_hex_length = 0
-    
-    if hex_lengths:
-        hex_lengths.sort()
-        n = len(hex_lengths)
-        if n % 2 == 0:
-            median_hex_length = (hex_lengths[n//2 - 1] + hex_lengths[n//2]) / 2
-        else:
-            median_hex_length = hex_lengths[n//2]
+    median_hex_length = statistics.median(hex_lengths) if hex_lengths else 0
     
     # Check hex integrity for all students (as anomalies, not illegal submissions)
     for student, data in student_data.items():
@@ -206,81 +335,128 @@ def check_plagiarism(root_path, filter_mode="threshold",
 
     print("Step 2: Calculating similarities...")
     students = list(student_data.keys())
-    pairs = list(itertools.combinations(students, 2))
+    # Source comparison uses compiled assembly when Keil compilation is enabled
+    src_key = 'asm_source' if use_keil_compilation else 'source'
+    sources = [student_data[student][src_key] for student in students]
+    hexes = [student_data[student]['hex'] for student in students]
 
-    all_comparisons = []
+    # Threshold mode only keeps pairs above a threshold, so scores that cannot
+    # reach it may short-circuit to 0. avg_score > src_threshold requires both
+    # source metrics >= 2 * src_threshold - 1 (the other one is at most 1.0).
+    # Cached rows are stored per cutoff, so cut-off scores are never reused
+    # by a run with a lower one.
+    src_cutoff = None
+    hex_cutoff = None
+    if filter_mode == "threshold":
+        src_cutoff = max(0.0, 2 * src_threshold - 1)
+        hex_cutoff = hex_threshold
 
-    for student1, student2 in tqdm(pairs, desc="Calculating pairs", unit="pair"):
-        # Source comparison
-        if use_keil_compilation:
-            src1 = student_data[student1]['asm_source']
-            src2 = student_data[student2]['asm_source']
-        else:
-            src1 = student_data[student1]['source']
-            src2 = student_data[student2]['source']
-            
-        src_sim = {'token_seq': 0, 'levenshtein': 0}
+    # Score every pair at once; hex comparison only uses Levenshtein
+    if cache:
+        src_hashes = [student_data[student]['content_hashes'][src_key] for student in students]
+        hex_hashes = [student_data[student]['content_hashes']['hex'] for student in students]
+        token_seq_matrix = cached_pairwise_similarity(cache, 'token_seq', sources, src_hashes,
+                                                      pairwise_token_sequence_similarity, src_cutoff)
+        src_lev_matrix = cached_pairwise_similarity(cache, 'levenshtein', sources, src_hashes,
+                                                    pairwise_levenshtein_similarity, src_cutoff)
+        hex_lev_matrix = cached_pairwise_similarity(cache, 'hex_levenshtein', hexes, hex_hashes,
+                                                    pairwise_levenshtein_similarity, hex_cutoff)
+    else:
+        token_seq_matrix = pairwise_token_sequence_similarity(sources, score_cutoff=src_cutoff)
+        src_lev_matrix = pairwise_levenshtein_similarity(sources, score_cutoff=src_cutoff)
+        hex_lev_matrix = pairwise_levenshtein_similarity(hexes, score_cutoff=hex_cutoff)
 
-        if src1 and src2:
-            src_sim = calculate_combined_similarity(src1, src2)
-
-        # Hex comparison - only use Levenshtein
-        hex1 = student_data[student1]['hex']
-        hex2 = student_data[student2]['hex']
-        hex_lev = 0
-        if hex1 and hex2:
-            hex_lev = calculate_levenshtein_similarity(hex1, hex2)
-   
-        # Calculate scores
-        max_hex_sim = hex_lev
-        avg_score = (src_sim['token_seq'] + src_sim['levenshtein']) / 2.0
-        
-        # Store all data for filtering
-        all_comparisons.append({
-            'student1': student1,
-            'student2': student2,
-            'source_similarity': src_sim,
-            'hex_levenshtein': hex_lev,
-            'max_hex_sim': max_hex_sim,
-            'avg_score': avg_score
-        })
+    # Per-pair scores as flat arrays in itertools.combinations order; a pair
+    # only gets a source (hex) score when both students have source (hex) data
+    idx_i, idx_j = np.triu_indices(len(students), k=1)
+    has_src = np.array([bool(text) for text in sources], dtype=bool)
+    has_hex = np.array([bool(text) for text in hexes], dtype=bool)
+    src_pair = has_src[idx_i] & has_src[idx_j]
+    hex_pair = has_hex[idx_i] & has_hex[idx_j]
+    token_seq = np.where(src_pair, token_seq_matrix[idx_i, idx_j], 0.0)
+    src_lev = np.where(src_pair, src_lev_matrix[idx_i, idx_j], 0.0)
+    hex_lev = np.where(hex_pair, hex_lev_matrix[idx_i, idx_j], 0.0)
+    avg_score = (token_seq + src_lev) / 2.0
 
     print(f"Step 3: Filtering pairs (Mode: {filter_mode})...")
-    filtered_pairs = []
 
     if filter_mode == "threshold":
         # Filter by threshold
         # Mode 1: Check if Average Score > SRC_THRESHOLD OR Hex > HEX_THRESHOLD
-        for comp in all_comparisons:
-            if comp['max_hex_sim'] > hex_threshold or comp['avg_score'] > src_threshold:
-                filtered_pairs.append(comp)
-                
+        selected = np.flatnonzero((hex_lev > hex_threshold) | (avg_score > src_threshold))
+
     elif filter_mode == "top_percent":
         # Sort and take top N%
-        total_pairs = len(all_comparisons)
+        total_pairs = len(avg_score)
         top_n = int(total_pairs * top_percent)
         if top_n < 1: top_n = 1
-        
+
         # Determine sort key
-        def get_sort_key(comp):
-            if top_metric == "avg_score":
-                return comp['avg_score'] # Average of 2 source metrics
-            elif top_metric == "levenshtein":
-                return comp['source_similarity']['levenshtein'] # Ignore Hex levenshtein
-            elif top_metric in comp['source_similarity']:
-                return comp['source_similarity'][top_metric]
-            else:
-                return comp['avg_score'] # Fallback
-        
-        all_comparisons.sort(key=get_sort_key, reverse=True)
-        filtered_pairs = all_comparisons[:top_n]
+        if top_metric == "levenshtein":
+            sort_key = src_lev # Ignore Hex levenshtein
+        elif top_metric == "token_seq":
+            sort_key = token_seq
+        else:
+            sort_key = avg_score # Average of 2 source metrics (also the fallback)
+
+        # Stable descending sort keeps ties in pair order
+        selected = np.argsort(-sort_key, kind='stable')[:top_n]
         print(f"Selected top {top_n} pairs ({top_percent*100}%) based on {top_metric}")
 
+    else:
+        selected = np.array([], dtype=np.intp)
+
+    # Only the selected pairs are turned into comparison dicts
+    filtered_pairs = []
+    for k in selected:
+        i, j = int(idx_i[k]), int(idx_j[k])
+        src_sim = {'token_seq': 0, 'levenshtein': 0}
+        if src_pair[k]:
+            src_sim = {'token_seq': float(token_seq[k]), 'levenshtein': float(src_lev[k])}
+        pair_hex_lev = float(hex_lev[k]) if hex_pair[k] else 0
+
+        # A pair kept by one threshold is reported with all of its scores,
+        # so restore exact values for any score that was cut off
+        if src_cutoff is not None:
+            if src_pair[k] and min(src_sim.values()) < src_cutoff:
+                src_sim = calculate_combined_similarity(sources[i], sources[j])
+            if hex_pair[k] and pair_hex_lev < hex_cutoff:
+                pair_hex_lev = calculate_levenshtein_similarity(hexes[i], hexes[j])
+
+        filtered_pairs.append({
+            'student1': students[i],
+            'student2': students[j],
+            'source_similarity': src_sim,
+            'hex_levenshtein': pair_hex_lev,
+            'max_hex_sim': pair_hex_lev,
+            'avg_score': (src_sim['token_seq'] + src_sim['levenshtein']) / 2.0
+        })
+
     
     print(f"Step 4: Analyzing {len(filtered_pairs)} suspicious pairs...")
     results = []
+
+    # Rule 1: Hex max score = 1.0 OR Source avg score = 1.0 → Definite plagiarism, skip LLM
+    def is_definite(comp):
+        return comp['max_hex_sim'] == 1.0 or comp['avg_score'] == 1.0
+
+    # Rule 2: Trigger LLM for ALL suspicious pairs (except definite plagiarism)
+    # Requests run concurrently; results are matched back by pair index
+    llm_results = {}
+    llm_indices = [idx for idx, comp in enumerate(filtered_pairs) if not is_definite(comp)]
+    if llm_indices:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=LLM_MAX_WORKERS) as executor:
+            futures = {
+                executor.submit(analyze_pair_with_llm,
+                                student_data[filtered_pairs[idx]['student1']]['source'],
+                                student_data[filtered_pairs[idx]['student2']]['source']): idx
+                for idx in llm_indices
+            }
+            for future in tqdm(concurrent.futures.as_completed(futures), total=len(futures),
+                               desc="Analyzing pairs", unit="pair"):
+                llm_results[futures[future]] = future.result()
     
-    for comp in tqdm(filtered_pairs, desc="Analyzing pairs", unit="pair"):
+    for idx, comp in enumerate(filtered_pairs):
         student1 = comp['student1']
         student2 = comp['student2']
         
@@ -289,20 +465,14 @@ def check_plagiarism(root_path, filter_mode="threshold",
         verdict = "未抄襲"
         verdict_reason = ""
         
-        # Rule 1: Hex max score = 1.0 OR Source avg score = 1.0 → Definite plagiarism, skip LLM
-        if comp['max_hex_sim'] == 1.0 or comp['avg_score'] == 1.0:
+        if is_definite(comp):
             verdict = "抄襲"
             verdict_reason = "Hex檔案或原始碼完全相同 (100%)"
             llm_triggered = False
 
-        # Rule 2: Trigger LLM for ALL suspicious pairs (except definite plagiarism)
         else:
             llm_triggered = True
-            # Need to retrieve source code again
-            src1 = student_data[student1]['source']
-            src2 = student_data[student2]['source']
-            
-            llm_result = analyze_pair_with_llm(src1, src2)
+            llm_result = llm_results[idx]
             
             # Rule 3: Use LLM result if available
             if llm_result and 'is_plagiarized' in llm_result:
@@ -377,7 +547,7 @@ def check_plagiarism(root_path, filter_mode="threshold",
     # Generate Report
     generate_html_report(results, hex_threshold, src_threshold, illegal_students, anomaly_students, lab_name,
                         filter_mode=filter_mode, top_metric=top_metric, top_percent=top_percent,
-                        use_keil_compilation=use_keil_compilation)
+                        use_keil_compilation=use_keil_compilation, gzip_report=gzip_report)
     
     return results
 
@@ -402,6 +572,12 @@ if __name__ == "__main__":
     # C51 Compilation Configuration
     USE_KEIL_COMPILATION = False  # Set to True to enable C compilation
     KEIL_PATH = None              # Set path if not in default locations
+    
+    # Reuse results for unchanged submissions across runs (None to disable)
+    CACHE_DIR = None              # e.g. ".plagiarism_cache"
+    
+    # Also write a gzip-compressed copy of the report (reports/*.html.gz)
+    GZIP_REPORT = False
     # ---------------------
 
     repo_root = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
@@ -417,7 +593,9 @@ if __name__ == "__main__":
         top_percent=TOP_PERCENT,
         lab_name=LAB_NAME,
         use_keil_compilation=USE_KEIL_COMPILATION,
-        keil_path=KEIL_PATH
+        keil_path=KEIL_PATH,
+        cache_dir=CACHE_DIR,
+        gzip_report=GZIP_REPORT
     )
     
 
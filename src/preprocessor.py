@@ -1,7 +1,27 @@
 """Preprocessor utilities (moved to src root)."""
+import functools
 import os
 import re
 
+# Assembly: comments and the whitespace around them collapse to one space
+_ASM_COMMENT_WS_RE = re.compile(r'(?:\s|;.*)+')
+# Hex immediates in one pass: 0x?? -> ??h (unless already followed by a word
+# character) and ??h with leading zeros stripped, either way
+_ASM_HEX_RE = re.compile(r'\b0x0*([0-9a-f]+)(?!\w)|\b0+([0-9a-f]+h)')
+_HEX_ZEROS_RE = re.compile(r'\b0+([0-9a-f]+)')
+# C: line continuations, comments and preprocessor directives
+_C_LINE_CONTINUATION_RE = re.compile(r'\\\s*\n')
+_C_BLOCK_COMMENT_RE = re.compile(r'/\*.*?\*/', re.DOTALL)
+_C_LINE_COMMENT_RE = re.compile(r'//.*')
+_C_DIRECTIVE_RE = re.compile(r'\s*#\s*(\w+)?')
+# File extensions that count as source code
+_SOURCE_EXTENSIONS = ('.a51', '.asm', '.c')
+# Intel HEX: value of every two-digit hex field, in any letter case
+_HEX_FIELD_VALUES = {f'{a}{b}'.encode('ascii'): int(a + b, 16)
+                     for a in '0123456789abcdefABCDEF' for b in '0123456789abcdefABCDEF'}
+# Assembly source check: instructions a complete program is expected to use
+_KEY_INSTRUCTIONS = frozenset({'org', 'end', 'mov', 'jmp', 'call', 'ret'})
+
 def crawl_directory(root_path):
     """
     Recursively finds relevant files (.a51, .hex) in the directory.
@@ -11,42 +31,83 @@ def crawl_directory(root_path):
     """
     student_files = {}
     
-    # Walk through the directory
-    for root, dirs, files in os.walk(root_path):
-        # Assuming the immediate subdirectories of root_path are student folders
-        # We need to identify which folder belongs to which student
-        # The structure seems to be: root_path / student_folder / files...
-        
-        rel_path = os.path.relpath(root, root_path)
-        if rel_path == '.':
-            continue
-            
-        # Extract student ID from the first level folder
-        path_parts = rel_path.split(os.sep)
-        student_id = path_parts[0]
-        
-        if student_id not in student_files:
-            student_files[student_id] = {'source': [], 'hex': [], 'all_files': []}
-            
-        for file in files:
-            ext = os.path.splitext(file)[1].lower()
-            full_path = os.path.join(root, file)
-            
-            student_files[student_id]['all_files'].append(full_path)
-            
-            if ext in ['.a51', '.asm', '.c']:  # .a51, .asm, and .c files are valid source code
-                student_files[student_id]['source'].append(full_path)
-            elif ext == '.hex':
-                student_files[student_id]['hex'].append(full_path)
+    # The structure is: root_path / student_folder / files...
+    # Files directly under root_path don't belong to any student
+    for entry in _list_dir(root_path) or []:
+        if _entry_kind(entry) == 'dir':
+            _crawl_student_dir(entry.path, entry.name, student_files)
                 
     return student_files
 
+def _list_dir(path):
+    """
+    Entries of a directory from os.scandir, or None if it cannot be read.
+    """
+    try:
+        with os.scandir(path) as it:
+            return list(it)
+    except OSError:
+        return None
+
+def _entry_kind(entry):
+    """
+    'dir', 'link' (symlinked directory, not followed) or 'file', decided like
+    os.walk does. DirEntry answers from the directory listing, so this
+    usually needs no stat call.
+    """
+    try:
+        is_dir = entry.is_dir()
+    except OSError:
+        is_dir = False
+    if not is_dir:
+        return 'file'
+    try:
+        is_symlink = entry.is_symlink()
+    except OSError:
+        is_symlink = False
+    return 'link' if is_symlink else 'dir'
+
+def _crawl_student_dir(path, student_id, student_files):
+    """
+    Adds the files under path to student_id's lists in os.walk order:
+    files of a folder first, then its subfolders in listing order.
+    """
+    entries = _list_dir(path)
+    if entries is None:
+        return
+    
+    if student_id not in student_files:
+        student_files[student_id] = {'source': [], 'hex': [], 'all_files': []}
+    
+    subdirs = []
+    for entry in entries:
+        kind = _entry_kind(entry)
+        if kind == 'dir':
+            subdirs.append(entry.path)
+        if kind != 'file':
+            continue
+        
+        # Leading dots are not an extension separator (".c" has none), as in
+        # os.path.splitext
+        name = entry.name.lower().lstrip('.')
+        full_path = entry.path
+        
+        student_files[student_id]['all_files'].append(full_path)
+        
+        if name.endswith(_SOURCE_EXTENSIONS):  # .a51, .asm, and .c files are valid source code
+            student_files[student_id]['source'].append(full_path)
+        elif name.endswith('.hex'):
+            student_files[student_id]['hex'].append(full_path)
+    
+    for subdir in subdirs:
+        _crawl_student_dir(subdir, student_id, student_files)
+
 def preprocess_c_code(content):
     """
     Enhanced C preprocessing that handles C preprocessor directives without requiring Keil C51.
     """
     # First, handle line continuations (backslash at end of line)
-    content = re.sub(r'\\\s*\n', ' ', content)
+    content = _C_LINE_CONTINUATION_RE.sub(' ', content)
 
     # Remove C comments (both single-line and multi-line) while preserving line structure
     # Use a function to preserve line count for proper line numbers after preprocessing
@@ -54,9 +115,9 @@ def preprocess_c_code(content):
         return '\n' * match.group(0).count('\n')
 
     # Handle multi-line comments first
-    content = re.sub(r'/\*.*?\*/', replace_comments, content, flags=re.DOTALL)
+    content = _C_BLOCK_COMMENT_RE.sub(replace_comments, content)
     # Handle single-line comments
-    content = re.sub(r'//.*', '', content)
+    content = _C_LINE_COMMENT_RE.sub('', content)
 
     # Process preprocessor directives
     # Split content into lines to process directives that start lines
@@ -65,11 +126,11 @@ def preprocess_c_code(content):
     skip_nesting = 0  # Track nested #ifdef/#ifndef blocks
 
     for line in lines:
-        # Check if the line starts with # at the beginning (ignoring leading whitespace)
-        if re.match(r'^\s*#', line):
-            # Extract the directive after the #
-            directive_match = re.match(r'^\s*#\s*(\w+)', line)
-            if directive_match:
+        # Check if the line starts with # at the beginning (ignoring leading whitespace),
+        # and extract the directive after the #
+        directive_match = _C_DIRECTIVE_RE.match(line)
+        if directive_match:
+            if directive_match.group(1):
                 cmd = directive_match.group(1).lower()
 
                 # Handle conditional compilation directives
@@ -112,54 +173,99 @@ def preprocess_c_code(content):
 
     content = '\n'.join(processed_lines)
 
-    # Normalize all whitespace (newlines, tabs, spaces) to single spaces
-    content = re.sub(r'\s+', ' ', content)
+    # Normalize all whitespace (newlines, tabs, spaces) to single spaces;
+    # str.split() uses the same whitespace set as the regex \s
+    content = ' '.join(content.split())
 
     # Convert to lowercase for case-insensitive comparison
     content = content.lower()
 
     # For C code, keep hex in 0x format (don't convert to assembly h suffix)
     # Just ensure consistent formatting
-    content = re.sub(r'\b0+([0-9a-f]+)', r'\1', content)  # Strip leading zeros in hex values
+    if '0' in content:
+        content = _HEX_ZEROS_RE.sub(r'\1', content)  # Strip leading zeros in hex values
 
     return content.strip()
 
 
+def _asm_hex_repl(match):
+    """
+    Replacement for _ASM_HEX_RE: 0x form gets an h suffix, h form keeps its digits.
+    """
+    if match.group(1) is not None:
+        return match.group(1) + 'h'
+    return match.group(2)
+
+def _clean_asm_code(content):
+    """
+    Assembly: drop ; comments, normalize whitespace, case and hex immediates.
+    """
+    # Assembly comments start with ; and are removed in the same pass
+    # that normalizes whitespace
+    content = _ASM_COMMENT_WS_RE.sub(' ', content)
+    content = content.lower()
+    # Normalize hex immediates: 0x?? -> ??h (assembly-specific) and strip
+    # leading zeros from hex values ending in h. Both forms start with a 0.
+    if '0' in content:
+        content = _ASM_HEX_RE.sub(_asm_hex_repl, content)
+    return content
+
+def _clean_text(content):
+    """
+    Other extensions: normalize whitespace and case only.
+    """
+    content = ' '.join(content.split())
+    content = content.lower()
+    # For other text files, just strip leading zeros in hex values but keep 0x format
+    if '0' in content:
+        content = _HEX_ZEROS_RE.sub(r'\1', content)
+    return content
+
+# Cleaner for each source extension, anything else is treated as plain text
+_CLEANERS = {
+    '.a51': _clean_asm_code,
+    '.asm': _clean_asm_code,
+    '.c': preprocess_c_code,  # Enhanced C preprocessing
+}
+
+@functools.lru_cache(maxsize=4096)
 def clean_code(content, file_extension):
     """
     Removes comments and normalizes whitespace.
+    
+    Results are memoized: starter code and copied files are submitted
+    verbatim by many students, so identical content is only cleaned once
+    (per worker process).
     """
+    if not content:
+        return ''
+    
     # Remove comments based on extension
-    if file_extension in ['.a51', '.asm']:
-        # Assembly comments start with ;
-        content = re.sub(r';.*', '', content)
-        # Apply same normalization as before for assembly files
-        content = re.sub(r'\s+', ' ', content)
-        content = content.lower()
-        # Normalize hex immediates: 0x?? -> ??h (assembly-specific)
-        # But be careful not to double-convert values that already have h suffix
-        content = re.sub(r'\b0x([0-9a-f]+)(?!\w)', r'\1h', content)  # Only convert if not already followed by h or other word character
-        # Strip leading zeros from hex values ending in h
-        content = re.sub(r'\b0+([0-9a-f]+h)', r'\1', content)
-    elif file_extension in ['.c']: # Enhanced C preprocessing
-        content = preprocess_c_code(content)
-    else:
-        # For other extensions, normalize whitespace and convert to lowercase
-        content = re.sub(r'\s+', ' ', content)
-        content = content.lower()
-        # For other text files, just strip leading zeros in hex values but keep 0x format
-        content = re.sub(r'\b0+([0-9a-f]+)', r'\1', content)
+    cleaner = _CLEANERS.get(file_extension, _clean_text)
+    return cleaner(content).strip()
 
-    return content.strip()
+def _parse_hex_field(field):
+    """
+    Value of a two-digit Intel HEX field given as bytes.
+    Plain hex digits come from a lookup table; anything else goes through
+    int() so it is accepted or rejected (with the same message) as before.
+    """
+    value = _HEX_FIELD_VALUES.get(field)
+    if value is None:
+        value = int(field.decode('latin-1'), 16)
+    return value
 
 def normalize_hex(content):
     """
     Parses Intel HEX format, extracts data payload.
+    Accepts the file as raw bytes (preferred, Intel HEX is plain ASCII) or str.
     Returns: (data_payload, hex_info)
         - data_payload: extracted hex data
         - hex_info: dict with validation information
     """
-    data_payload = ""
+    if isinstance(content, str):
+        content = content.encode('utf-8')
+    data_chunks = []
     lines = content.splitlines()
     has_eof = False
     format_errors = []
@@ -169,7 +275,7 @@ def normalize_hex(content):
         line = line.strip()
         if not line:
             continue
-        if not line.startswith(':'):
+        if not line.startswith(b':'):
             format_errors.append(f"Line {line_num}: Missing ':' prefix")
             continue
             
@@ -179,8 +285,8 @@ def normalize_hex(content):
                 format_errors.append(f"Line {line_num}: Line too short")
                 continue
                 
-            byte_count = int(line[1:3], 16)
-            record_type = int(line[7:9], 16)
+            byte_count = _parse_hex_field(line[1:3])
+            record_type = _parse_hex_field(line[7:9])
             
             # Record Type 00 is Data
             if record_type == 0:
@@ -190,8 +296,7 @@ def normalize_hex(content):
                 if len(line) < data_end:
                     format_errors.append(f"Line {line_num}: Insufficient data")
                     continue
-                data = line[data_start:data_end]
-                data_payload += data
+                data_chunks.append(line[data_start:data_end])
                 valid_lines += 1
             # Record Type 01 is EOF
             elif record_type == 1:
@@ -200,6 +305,9 @@ def normalize_hex(content):
             format_errors.append(f"Line {line_num}: Parse error - {str(e)}")
             continue
     
+    # latin-1 keeps one character per byte, so lengths match the raw data
+    data_payload = b''.join(data_chunks).lower().decode('latin-1')
+    
     hex_info = {
         'has_eof': has_eof,
         'format_errors': format_errors,
@@ -207,7 +315,7 @@ def normalize_hex(content):
         'data_length': len(data_payload)
     }
     
-    return data_payload.lower(), hex_info
+    return data_payload, hex_info
 
 
 def validate_source_code(content, file_extension):
@@ -235,10 +343,7 @@ def validate_source_code(content, file_extension):
     blank_lines = 0
     comment_lines = 0
     code_lines = 0
-    instructions = []
     
-    # Key assembly instructions to look for
-    key_instructions = ['org', 'end', 'mov', 'jmp', 'call', 'ret']
     found_instructions = set()
     
     for line in lines:
@@ -250,21 +355,22 @@ def validate_source_code(content, file_extension):
             comment_lines += 1
         else:
             code_lines += 1
-            # Extract instruction (first word)
-            parts = stripped.lower().split()
-            if parts:
-                instr = parts[0].rstrip(':')  # Remove label colon
-                instructions.append(instr)
-                if instr in key_instructions:
-                    found_instructions.add(instr)
+            # Extract instruction (first word); only that word is split off
+            # and lowercased, not the whole line
+            instr = stripped.split(None, 1)[0].lower().rstrip(':')  # Remove label colon
+            if instr in _KEY_INSTRUCTIONS:
+                found_instructions.add(instr)
+    
+    # Every code line starts with one instruction word
+    instruction_count = code_lines
     
     # Check 1: Minimum instruction count
-    if len(instructions) < 10:
+    if instruction_count < 10:
         anomalies.append({
             'code': 'FEW_INSTRUCTIONS',
             'severity': 'warning',
-            'message': f'指令數量過少 ({len(instructions)} 條)',
-            'details': {'count': len(instructions)}
+            'message': f'指令數量過少 ({instruction_count} 條)',
+            'details': {'count': instruction_count}
         })
     
     # Check 2: Key instructions existence
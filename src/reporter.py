@@ -1,27 +1,37 @@
 """HTML reporter (moved to src root)."""
+import functools
+import gzip
 import os
 import html
 import json
+import re
 
-def generate_html_report(results, hex_threshold, src_threshold, illegal_students=[], anomaly_students=[], lab_name="Lab", 
-                        filter_mode="threshold", top_metric="max_score", top_percent=0.05, use_keil_compilation=False):
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Reports are written under the repository root `reports/` directory
+# (src/reporter.py -> repo root is one level up)
+_REPORTS_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir, "reports"))
+
+def _minify(markup):
     """
-    Generates an HTML report from the plagiarism results.
+    Drops indentation, blank lines and whole-line comments from static markup.
+    Line breaks are kept, so JS statements and trailing // comments still end
+    where they did.
     """
-    # Write reports under repository root `reports/` directory
-    # src/reporter.py -> repo root is one level up
-    base_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
-    reports_dir = os.path.join(base_dir, "reports")
-    os.makedirs(reports_dir, exist_ok=True)
-    output_file = os.path.join(reports_dir, f"{lab_name.replace(' ', '')}_plagiarism_report.html")
-    
-    # Format filter description
-    if filter_mode == "threshold":
-        filter_desc = f"Threshold Mode (Hex > {hex_threshold}, Source > {src_threshold})"
-    else:
-        filter_desc = f"Top Percent Mode (Top {top_percent*100}% by {top_metric})"
+    lines = []
+    for line in markup.splitlines():
+        line = line.strip()
+        if line and not line.startswith('//') and not (line.startswith('/*') and line.endswith('*/')):
+            lines.append(line)
+    return '\n'.join(lines) + '\n'
 
-    html_content = """
+# Static parts of the report, built once at import and written minified;
+# the readable form stays here.
+# Page head up to the summary line; filled in with str.format, so CSS braces are doubled
+_REPORT_HEAD = _minify("""
     <!DOCTYPE html>
     <html lang="en">
     <head>
@@ -54,17 +64,6 @@ def generate_html_report(results, hex_threshold, src_threshold, illegal_students
             .code-block h3 {{ margin: 10px; background: #eee; padding: 5px; border-radius: 4px; }}
             .code-container {{ flex: 1; overflow: auto; position: relative; background: #f8f8f8; display: flex; }}
             
-            .line-numbers {{ 
-                padding: 10px 5px; 
-                background: #e0e0e0; 
-                color: #888; 
-                text-align: right; 
-                font-family: monospace; 
-                font-size: 14px; 
-                line-height: 1.5;
-                min-width: 40px;
-                user-select: none;
-            }}
             pre {{ 
                 margin: 0; 
                 padding: 10px; 
@@ -74,9 +73,25 @@ def generate_html_report(results, hex_threshold, src_threshold, illegal_students
                 white-space: pre; 
                 overflow: visible; /* Let container handle scroll */
             }}
+            /* Source views: one span per line, numbered with a CSS counter */
+            pre.numbered {{ counter-reset: line; padding-left: 0; }}
+            pre.numbered .ln {{ counter-increment: line; }}
+            pre.numbered .ln::before {{
+                content: counter(line);
+                display: inline-block;
+                min-width: 40px;
+                padding: 0 5px;
+                margin-right: 10px;
+                background: #e0e0e0;
+                color: #888;
+                text-align: right;
+                user-select: none;
+            }}
             
             .llm-analysis {{ background: #e8f6f3; padding: 15px; border-left: 5px solid #1abc9c; margin-bottom: 20px; }}
             .llm-title {{ font-weight: bold; color: #16a085; margin-bottom: 5px; }}
+            /* Filled via textContent, so keep line breaks of multi-line reasons */
+            #analysis-content {{ white-space: pre-line; }}
             
             .illegal-warning {{
                 background-color: #ffebee;
@@ -87,6 +102,7 @@ def generate_html_report(results, hex_threshold, src_threshold, illegal_students
                 border-radius: 4px;
                 font-weight: bold;
                 text-align: center;
+                white-space: pre-line;
             }}
             
             .filter-info {{
@@ -141,7 +157,6 @@ def generate_html_report(results, hex_threshold, src_threshold, illegal_students
                 background: #2980b9;
             }}
         </style>
-        <script src="https://cdn.jsdelivr.net/npm/chart.js"></script>
     </head>
     <body>
         <div class="container">
@@ -151,10 +166,10 @@ def generate_html_report(results, hex_threshold, src_threshold, illegal_students
                 <strong>Total Suspicious Pairs:</strong> {total_pairs}
             </div>
             
-    """.format(lab_name=lab_name, total_pairs=len(results), filter_desc=filter_desc)
-    
-    # Add explanation section
-    html_content += """
+    """)
+
+# Collapsible explanation of the similarity metrics
+_EXPLANATION_HTML = _minify("""
             <div style="margin: 20px 0; padding: 15px; background: #f0f8ff; border-left: 4px solid #3498db; border-radius: 4px;">
                 <h3 style="margin-top: 0; color: #2c3e50; cursor: pointer;" onclick="toggleExplanation()">
                     📊 相似度演算法說明 <span id="toggle-icon">▼</span>
@@ -202,284 +217,10 @@ def generate_html_report(results, hex_threshold, src_threshold, illegal_students
                     }
                 }
             </script>
-    """
-    
-    # Add anomaly section - between plagiarism and illegal submissions
-    if anomaly_students:
-        html_content += f"""
-            <div class="anomaly-section">
-                <h3 class="anomaly-header">⚠️ 檔案異常警告 ({len(anomaly_students)} 位學生)</h3>
-                <p>以下學生的檔案存在異常，但仍參與抄襲比對分析。點擊「查看詳情」可檢視原始碼和 Hex 檔案。</p>
-                <table style="width: 100%; margin-top: 10px;">
-                    <thead>
-                        <tr style="background: #f39c12;">
-                            <th>Student</th>
-                            <th>異常類型</th>
-                            <th>詳細說明</th>
-                            <th>操作</th>
-                        </tr>
-                    </thead>
-                    <tbody>
-        """
-        for student in anomaly_students:
-            # Determine anomaly types
-            anomaly_types = []
-            if student['hex_anomalies']:
-                anomaly_types.append('Hex 檔案')
-            if student['source_anomalies']:
-                anomaly_types.append('原始碼')
-            
-            # Get summary of anomalies
-            anomaly_summary = []
-            for anom in student['hex_anomalies'][:2]:  # First 2 hex anomalies
-                anomaly_summary.append(anom['message'])
-            for anom in student['source_anomalies'][:2]:  # First 2 source anomalies
-                anomaly_summary.append(anom['message'])
-            
-            summary_text = '、'.join(anomaly_summary)
-            if len(student['hex_anomalies']) + len(student['source_anomalies']) > 4:
-                summary_text += '...'
-            
-            html_content += f"""
-                        <tr>
-                            <td><strong>{html.escape(student['student'])}</strong></td>
-                            <td>{' + '.join(anomaly_types)}</td>
-                            <td>{html.escape(summary_text)}</td>
-                            <td><button class="view-btn" onclick="openAnomalyModal('{html.escape(student['student'], quote=True)}')">查看詳情</button></td>
-                        </tr>
-                        
-                        <!-- Hidden data for anomaly modal -->
-                        <div id="anomaly-data-{html.escape(student['student'])}" style="display:none;">
-                            <div class="src-content">{html.escape(student.get('original_source', ''))}</div>
-                            <div class="hex-content">{html.escape(student.get('hex', ''))}</div>
-                            <div class="anomalies-json">{html.escape(json.dumps(student['hex_anomalies'] + student['source_anomalies']))}</div>
-                        </div>
-            """
-        html_content += """
-                    </tbody>
-                </table>
-            </div>
-        """
-    
-    # Add Illegal Submissions Section FIRST
-    if illegal_students:
-        html_content += f"""
-            <div class="illegal-section" style="margin: 20px 0; padding: 15px; background: #fff3cd; border-left: 4px solid #f39c12; border-radius: 4px;">
-                <h3 style="margin-top: 0; color: #e67e22;">⚠️ 無效提交名單 ({len(illegal_students)} 位學生)</h3>
-                <p>以下學生提交的檔案不符合規定格式（需包含 .c 或 .a51 原始碼，且必須包含 .hex 檔案）。</p>
-                <table style="width: 100%; margin-top: 10px;">
-                    <thead>
-                        <tr style="background: #f39c12;">
-                            <th>Student</th>
-                            <th>Reason</th>
-                        </tr>
-                    </thead>
-                    <tbody>
-        """
-        for student in illegal_students:
-            html_content += f"""
-                        <tr>
-                            <td><strong>{html.escape(student['student'])}</strong></td>
-                            <td>{html.escape(student['reason'])}</td>
-                        </tr>
-            """
-        html_content += """
-                    </tbody>
-                </table>
-            </div>
-        """
-    
-    # Add plagiarism summary section - only student names
-    plagiarized_pairs = [r for r in results if r.get('final_verdict') == '抄襲']
-    if plagiarized_pairs:
-        # Collect unique student names
-        plagiarized_students = set()
-        for pair in plagiarized_pairs:
-            plagiarized_students.add(pair['student1'])
-            plagiarized_students.add(pair['student2'])
-        
-        html_content += f"""
-            <div style="margin: 20px 0; padding: 15px; background: #ffebee; border-left: 4px solid #e74c3c; border-radius: 4px;">
-                <h3 style="margin-top: 0; color: #c0392b;">🚨 抄襲判定名單 ({len(plagiarized_students)} 位學生)</h3>
-                <ul style="columns: 3; -webkit-columns: 3; -moz-columns: 3; list-style-type: disc; padding-left: 20px;">
-        """
-        for student in sorted(plagiarized_students):
-            html_content += f"""
-                    <li><strong>{html.escape(student)}</strong></li>
-            """
-        html_content += """
-                </ul>
-            </div>
-        """
-    
-    
-    # Sort results by verdict priority: 抄襲 > 非法提交 > 未抄襲
-    # Sort results by verdict priority: 抄襲 > 非法提交 > 未抄襲
-    # Always sort by verdict priority first, then by score (which is already sorted in results)
-    def verdict_priority(res):
-        verdict = res.get('final_verdict', '未知')
-        if verdict == '抄襲':
-            return 0
-        elif verdict == '無效提交':
-            return 1
-        elif verdict == '未抄襲':
-            return 2
-        else:
-            return 3
-    
-    # Python's sort is stable, so it preserves the score order for items with same verdict
-    sorted_results = sorted(results, key=verdict_priority)
-    
-    # Generate description text based on filter mode
-    if filter_mode == "threshold":
-        description_text = f"Hex 任一相似度分數 >= {hex_threshold} 或 原始碼平均相似度分數 >= {src_threshold}"
-    else:  # top_percent
-        metric_name_map = {
-            "token_seq": "Token Sequence",
-            "levenshtein": "Levenshtein",
-            "avg_score": "平均分數"
-        }
-        metric_display = metric_name_map.get(top_metric, top_metric)
-        description_text = f"依據 {metric_display} 排序，取前 {top_percent*100}% 的配對組合"
-    
-    html_content += f"""
-            <h2 style="margin-top: 30px;">詳細比對列表 ({len(sorted_results)} 組)</h2>
-            <p style="color: #666;">{description_text}</p>
-    """
-    
-    # Determine table headers based on filter mode
-    hex_header = "Hex Score"  # Always use "Hex Score" for consistency
-    src_header = "Source (Avg)"  # Default to average
-    
-    if filter_mode == "top_percent":
-        if top_metric == "token_seq":
-            src_header = "Source (Token Seq)"
-        elif top_metric == "levenshtein":
-            src_header = "Source (Levenshtein)"
-        elif top_metric == "avg_score":
-            src_header = "Source (Avg)"
-    # In threshold mode, keep "Source (Avg)" as default
-            
-    html_content += f"""
-            <table>
-                <thead>
-                    <tr>
-                        <th>Rank</th>
-                        <th>Student 1</th>
-                        <th>Student 2</th>
-                        <th>{hex_header}</th>
-                        <th>{src_header}</th>
-                        <th>最終判定</th>
-                        <th>Details</th>
-                    </tr>
-                </thead>
-                <tbody>
-    """
-    
-    
-    for i, res in enumerate(sorted_results):
-        hex_comp = res.get('max_hex_sim', 0)
-        src_comp = res.get('avg_score', 0) # Default to average score
-        
-        # Override displayed scores if in top_percent mode with specific metric
-        if filter_mode == "top_percent":
-            if top_metric == "token_seq":
-                src_comp = res['source_similarity']['token_seq']
-                hex_comp = res.get('hex_levenshtein', 0)
-            elif top_metric == "levenshtein":
-                src_comp = res['source_similarity']['levenshtein']
-                hex_comp = res.get('hex_levenshtein', 0)
-            elif top_metric == "avg_score":
-                src_comp = res.get('avg_score', 0)
-                hex_comp = res.get('hex_levenshtein', 0)
-        verdict = res.get('final_verdict', '未知')
-        
-        # Color coding for verdict
-        if verdict == '抄襲':
-            verdict_html = '<span style="color: #e74c3c; font-weight: bold;">🔴 抄襲</span>'
-        elif verdict == '未抄襲':
-            verdict_html = '<span style="color: #27ae60; font-weight: bold;">🟢 未抄襲</span>'
-        elif verdict == '無效提交':
-            verdict_html = '<span style="color: #f39c12; font-weight: bold;">⚠️ 無效提交</span>'
-        else:  # 需人工審查 or 其他
-            verdict_html = '<span style="color: #95a5a6; font-weight: bold;">🟡 未知</span>'
-        
-        # Escape strings for JS
-        s1 = html.escape(res['student1'])
-        s2 = html.escape(res['student2'])
-        
-        # Use original source if available, else cleaned
-        code1_content = res.get('original_source1') or res.get('source_code1', 'Source not available')
-        code2_content = res.get('original_source2') or res.get('source_code2', 'Source not available')
-        
-        code1 = html.escape(code1_content)
-        code2 = html.escape(code2_content)
-        hex1 = html.escape(res.get('hex_code1', 'Hex not available'))
-        hex2 = html.escape(res.get('hex_code2', 'Hex not available'))
-        
-        llm_analysis = res.get('llm_analysis') or {}
-        llm_reasoning = html.escape(llm_analysis.get('reasoning', ''))
-        verdict_reason = html.escape(res.get('verdict_reason', ''))
-        
-        # Illegal status
-        ill1 = "true" if res.get('illegal_submission1') else "false"
-        reason1 = html.escape(res.get('illegal_reason1', ''))
-        ill2 = "true" if res.get('illegal_submission2') else "false"
-        reason2 = html.escape(res.get('illegal_reason2', ''))
-        
-        # JSON data for chart - restructured format
-        chart_data = {
-            'token_seq': [res['source_similarity']['token_seq'], 0],
-            'levenshtein': [res['source_similarity']['levenshtein'], res['hex_levenshtein']]
-        }
-        chart_json = html.escape(json.dumps(chart_data))
-        
-        # Format scores with bold based on filter mode
-        if filter_mode == "threshold":
-            # Threshold mode: bold if exceeding threshold
-            hex_display = f"<strong>{hex_comp:.2f}</strong>" if hex_comp > hex_threshold else f"{hex_comp:.2f}"
-            src_display = f"<strong>{src_comp:.2f}</strong>" if src_comp > src_threshold else f"{src_comp:.2f}"
-        else:  # top_percent mode
-            # Top percent mode: ALL results are already the top N% selected by main.py
-            # So we bold all source scores (since they were selected based on source metrics)
-            # Hex is never bolded because selection is not based on hex
-            hex_display = f"{hex_comp:.2f}"  # Never bold hex in top_percent mode
-            src_display = f"<strong>{src_comp:.2f}</strong>"  # All source scores are bold
-        
-        row = f"""
-            <tr onclick="openModal('{i}')">
-                <td>{i+1}</td>
-                <td>{s1}</td>
-                <td>{s2}</td>
-                <td>{hex_display}</td>
-                <td>{src_display}</td>
-                <td>{verdict_html}</td>
-                <td><button>View</button></td>
-            </tr>
-            
-            <!-- Hidden data for modal -->
-            <div id="data-{i}" style="display:none;">
-                <div class="student1">{s1}</div>
-                <div class="student2">{s2}</div>
-                <div class="code1">{code1}</div>
-                <div class="code2">{code2}</div>
-                <div class="hex1">{hex1}</div>
-                <div class="hex2">{hex2}</div>
-                <div class="llm-reasoning">{llm_reasoning}</div>
-                <div class="verdict-reason">{verdict_reason}</div>
-                <div class="illegal1" data-is-illegal="{ill1}">{reason1}</div>
-                <div class="illegal2" data-is-illegal="{ill2}">{reason2}</div>
-                <div class="chart-data">{chart_json}</div>
-            </div>
-        """
-        html_content += row
-
-    html_content += """
-                </tbody>
-            </table>
-    """
+    """)
 
-    html_content += r"""
+# Closing markup: comparison and anomaly modals and their scripts
+_REPORT_TAIL = _minify(r"""
         </div>
         
         <!-- Modal -->
@@ -504,8 +245,7 @@ def generate_html_report(results, hex_threshold, src_threshold, illegal_students
                         <h3 id="s1-name">Student 1</h3>
                         <div id="s1-warning" class="illegal-warning" style="display:none;"></div>
                         <div class="code-container">
-                            <div class="line-numbers" id="ln1"></div>
-                            <pre id="code1-view"></pre>
+                            <pre id="code1-view" class="numbered"></pre>
                         </div>
                         <h4 style="margin: 5px 10px;">Hex Data</h4>
                         <pre id="hex1-view" style="max-height: 60px; height: auto; margin: 0 10px 10px; overflow-y: auto; background: #f8f8f8; padding: 5px; border: 1px solid #ddd; border-radius: 4px;"></pre>
@@ -514,8 +254,7 @@ def generate_html_report(results, hex_threshold, src_threshold, illegal_students
                         <h3 id="s2-name">Student 2</h3>
                         <div id="s2-warning" class="illegal-warning" style="display:none;"></div>
                         <div class="code-container">
-                            <div class="line-numbers" id="ln2"></div>
-                            <pre id="code2-view"></pre>
+                            <pre id="code2-view" class="numbered"></pre>
                         </div>
                         <h4 style="margin: 5px 10px;">Hex Data</h4>
                         <pre id="hex2-view" style="max-height: 60px; height: auto; margin: 0 10px 10px; overflow-y: auto; background: #f8f8f8; padding: 5px; border: 1px solid #ddd; border-radius: 4px;"></pre>
@@ -525,106 +264,117 @@ def generate_html_report(results, hex_threshold, src_threshold, illegal_students
         </div>
 
         <script>
-            function removeComments(code) {
-                // Remove assembly comments (;)
-                code = code.replace(/;.*/g, '');
-                
-                // Remove C++ style comments (//)
-                code = code.replace(/\/\/.*/g, '');
-                
-                // Remove C style block comments (/* */)
-                code = code.replace(/\/\*[\s\S]*?\*\//g, '');
-                
-                // Remove empty lines and trim
-                code = code.split('\n')
-                    .map(line => line.trim())
-                    .filter(line => line.length > 0)
-                    .join('\n');
-                
-                return code;
+            // Shows text in a numbered <pre>, one .ln span per line
+            function showNumberedCode(pre, text) {
+                const frag = document.createDocumentFragment();
+                text.split('\n').forEach((line, i) => {
+                    if (i) frag.appendChild(document.createTextNode('\n'));
+                    const span = document.createElement('span');
+                    span.className = 'ln';
+                    span.textContent = line;
+                    frag.appendChild(span);
+                });
+                pre.textContent = '';
+                pre.appendChild(frag);
             }
-            
-            function generateLineNumbers(text) {
-                const lines = text.split('\n').length;
-                let nums = "";
-                for(let i=1; i<=lines; i++) {
-                    nums += i + "\n";
+
+            // Per-pair modal data and the source/hex texts it refers to,
+            // parsed from the embedded JSON the first time a modal opens
+            let PAIRS = null;
+            let BLOBS = null;
+            function pairData(id) {
+                if (PAIRS === null) {
+                    PAIRS = JSON.parse(document.getElementById('pairs').textContent);
+                    BLOBS = JSON.parse(document.getElementById('blobs').textContent);
                 }
-                return nums;
+                return PAIRS[id];
             }
 
             let myChart = null;
 
             function openModal(id) {
-                const data = document.getElementById('data-' + id);
-                document.getElementById('s1-name').innerText = data.querySelector('.student1').innerText;
-                document.getElementById('s2-name').innerText = data.querySelector('.student2').innerText;
-                
-                const code1Raw = data.querySelector('.code1').innerText;
-                const code2Raw = data.querySelector('.code2').innerText;
-                
-                // Remove comments from code before displaying
-                const code1 = removeComments(code1Raw);
-                const code2 = removeComments(code2Raw);
+                const data = pairData(id);
+                document.getElementById('s1-name').textContent = data.s1;
+                document.getElementById('s2-name').textContent = data.s2;
                 
-                document.getElementById('code1-view').innerText = code1;
-                document.getElementById('code2-view').innerText = code2;
+                // Source blobs already have comments removed
+                showNumberedCode(document.getElementById('code1-view'), BLOBS[data.code1]);
+                showNumberedCode(document.getElementById('code2-view'), BLOBS[data.code2]);
                 
-                document.getElementById('ln1').innerText = generateLineNumbers(code1);
-                document.getElementById('ln2').innerText = generateLineNumbers(code2);
-                
-                document.getElementById('hex1-view').innerText = data.querySelector('.hex1').innerText;
-                document.getElementById('hex2-view').innerText = data.querySelector('.hex2').innerText;
+                document.getElementById('hex1-view').textContent = BLOBS[data.hex1];
+                document.getElementById('hex2-view').textContent = BLOBS[data.hex2];
                 
                 
                 // Handle Illegal Warnings
-                const ill1 = data.querySelector('.illegal1');
-                const ill2 = data.querySelector('.illegal2');
-                
-                if (ill1.dataset.isIllegal === "true") {
+                if (data.ill1) {
                     document.getElementById('s1-warning').style.display = 'block';
-                    document.getElementById('s1-warning').innerText = ill1.innerText;
+                    document.getElementById('s1-warning').textContent = data.reason1;
                 } else {
                     document.getElementById('s1-warning').style.display = 'none';
                 }
                 
-                if (ill2.dataset.isIllegal === "true") {
+                if (data.ill2) {
                     document.getElementById('s2-warning').style.display = 'block';
-                    document.getElementById('s2-warning').innerText = ill2.innerText;
+                    document.getElementById('s2-warning').textContent = data.reason2;
                 } else {
                     document.getElementById('s2-warning').style.display = 'none';
                 }
                 
                 
                 // Handle Analysis Section - Always show either LLM or algorithm analysis
-                const llmReasoning = data.querySelector('.llm-reasoning').innerText;
-                const verdictReason = data.querySelector('.verdict-reason').innerText;
+                const llmReasoning = data.llm_reasoning;
+                const verdictReason = data.verdict_reason;
                 
                 if (llmReasoning) {
                     // LLM analysis available
-                    document.getElementById('analysis-title').innerText = 'LLM Analysis';
-                    document.getElementById('analysis-content').innerText = llmReasoning;
+                    document.getElementById('analysis-title').textContent = 'LLM Analysis';
+                    document.getElementById('analysis-content').textContent = llmReasoning;
                 } else if (verdictReason) {
                     // No LLM, show algorithm analysis
-                    document.getElementById('analysis-title').innerText = 'Algorithm Analysis';
-                    document.getElementById('analysis-content').innerText = verdictReason;
+                    document.getElementById('analysis-title').textContent = 'Algorithm Analysis';
+                    document.getElementById('analysis-content').textContent = verdictReason;
                 } else {
                     // Fallback
-                    document.getElementById('analysis-title').innerText = 'Analysis';
-                    document.getElementById('analysis-content').innerText = 'No analysis available';
+                    document.getElementById('analysis-title').textContent = 'Analysis';
+                    document.getElementById('analysis-content').textContent = 'No analysis available';
                 }
                 
                 
-                // Chart Generation
-                const chartDataRaw = data.querySelector('.chart-data').innerText;
-                const chartData = JSON.parse(chartDataRaw);
-                
-                const ctx = document.getElementById('comparisonChart').getContext('2d');
+                document.getElementById('myModal').style.display = "block";
                 
+                // Chart generation, once Chart.js has loaded
+                const chartData = data.chart;
+                loadChartJs().then(() => drawChart(chartData));
+            }
+            
+            // Chart.js is only fetched when the first comparison is opened
+            let chartJsLoading = null;
+            function loadChartJs() {
+                if (chartJsLoading === null) {
+                    chartJsLoading = new Promise((resolve, reject) => {
+                        const script = document.createElement('script');
+                        script.src = 'https://cdn.jsdelivr.net/npm/chart.js';
+                        script.onload = resolve;
+                        script.onerror = () => {
+                            chartJsLoading = null;  // Retry on the next open
+                            reject(new Error('Failed to load Chart.js'));
+                        };
+                        document.head.appendChild(script);
+                    });
+                }
+                return chartJsLoading;
+            }
+            
+            function drawChart(chartData) {
+                // One chart for the page; later opens only swap its data
                 if (myChart) {
-                    myChart.destroy();
+                    myChart.data.datasets[0].data = chartData.token_seq;
+                    myChart.data.datasets[1].data = chartData.levenshtein;
+                    myChart.update('none');
+                    return;
                 }
                 
+                const ctx = document.getElementById('comparisonChart').getContext('2d');
                 myChart = new Chart(ctx, {
                     type: 'bar',
                     data: {
@@ -649,6 +399,8 @@ def generate_html_report(results, hex_threshold, src_threshold, illegal_students
                     options: {
                         responsive: true,
                         maintainAspectRatio: false,
+                        animation: false,
+                        normalized: true,
                         scales: {
                             y: {
                                 beginAtZero: true,
@@ -677,41 +429,37 @@ def generate_html_report(results, hex_threshold, src_threshold, illegal_students
                         }
                     }
                 });
-                
-                document.getElementById('myModal').style.display = "block";
             }
 
             function closeModal() {
                 document.getElementById('myModal').style.display = "none";
             }
             
-            function openAnomalyModal(studentName) {
-                const dataDiv = document.getElementById('anomaly-data-' + studentName);
-                if (!dataDiv) return;
-                
-                const srcContent = dataDiv.querySelector('.src-content').innerText;
-                const hexContent = dataDiv.querySelector('.hex-content').innerText;
-                const anomaliesJson = dataDiv.querySelector('.anomalies-json').innerText;
-                const anomalies = JSON.parse(anomaliesJson);
+            // Anomaly modal data, parsed from the embedded JSON on first open
+            let ANOMALIES = null;
+            function openAnomalyModal(index) {
+                if (ANOMALIES === null) {
+                    ANOMALIES = JSON.parse(document.getElementById('anomaly-data').textContent);
+                }
+                const entry = ANOMALIES[index];
+                const srcContent = entry.src;
+                const hexContent = entry.hex;
+                const anomalies = entry.anomalies;
                 
                 // Set title
-                document.getElementById('anomaly-student-title').innerText = '檔案異常詳情 - ' + studentName;
+                document.getElementById('anomaly-student-title').textContent = '檔案異常詳情 - ' + entry.student;
                 
                 // Set source code with line numbers
-                document.getElementById('anomaly-src-content').innerText = srcContent;
-                const lines = srcContent.split('\n').length;
-                let lineNumbers = '';
-                for (let i = 1; i <= lines; i++) {
-                    lineNumbers += i + '\n';
-                }
-                document.getElementById('anomaly-src-lines').innerText = lineNumbers;
+                showNumberedCode(document.getElementById('anomaly-src-content'), srcContent);
                 
                 // Set hex content
-                document.getElementById('anomaly-hex-content').innerText = hexContent;
+                document.getElementById('anomaly-hex-content').textContent = hexContent;
                 
                 // Set anomalies list
+                // Built off-document and attached in one append
                 const listDiv = document.getElementById('anomaly-list');
-                listDiv.innerHTML = '';
+                listDiv.textContent = '';
+                const frag = document.createDocumentFragment();
                 
                 anomalies.forEach(anom => {
                     const item = document.createElement('div');
@@ -723,17 +471,23 @@ def generate_html_report(results, hex_threshold, src_threshold, illegal_students
                     item.style.marginBottom = '10px';
                     item.style.borderRadius = '4px';
                     
-                    let html = `<strong>[${anom.code}] ${anom.message}</strong>`;
+                    const title = document.createElement('strong');
+                    title.textContent = `[${anom.code}] ${anom.message}`;
+                    item.appendChild(title);
                     if (anom.details) {
-                        html += '<ul style="margin: 5px 0 0 20px; font-size: 12px;">';
+                        const list = document.createElement('ul');
+                        list.style.margin = '5px 0 0 20px';
+                        list.style.fontSize = '12px';
                         for (const [key, value] of Object.entries(anom.details)) {
-                            html += `<li>${key}: ${value}</li>`;
+                            const entry = document.createElement('li');
+                            entry.textContent = `${key}: ${value}`;
+                            list.appendChild(entry);
                         }
-                        html += '</ul>';
+                        item.appendChild(list);
                     }
-                    item.innerHTML = html;
-                    listDiv.appendChild(item);
+                    frag.appendChild(item);
                 });
+                listDiv.appendChild(frag);
                 
                 document.getElementById('anomalyModal').style.display = "block";
             }
@@ -763,8 +517,7 @@ def generate_html_report(results, hex_threshold, src_threshold, illegal_students
                     <div class="code-block" style="flex: 1;">
                         <h3>原始碼</h3>
                         <div class="code-container">
-                            <div class="line-numbers" id="anomaly-src-lines"></div>
-                            <pre id="anomaly-src-content"></pre>
+                            <pre id="anomaly-src-content" class="numbered"></pre>
                         </div>
                     </div>
                     
@@ -788,8 +541,398 @@ def generate_html_report(results, hex_threshold, src_threshold, illegal_students
         </div>
     </body>
     </html>
+    """)
+
+# Color-coded verdict labels for the result table
+_VERDICT_HTML = {
+    '抄襲': '<span style="color: #e74c3c; font-weight: bold;">🔴 抄襲</span>',
+    '未抄襲': '<span style="color: #27ae60; font-weight: bold;">🟢 未抄襲</span>',
+    '無效提交': '<span style="color: #f39c12; font-weight: bold;">⚠️ 無效提交</span>',
+}
+_VERDICT_HTML_UNKNOWN = '<span style="color: #95a5a6; font-weight: bold;">🟡 未知</span>'  # 需人工審查 or 其他
+
+# Order of the verdict groups in the detail table; anything else goes last
+_VERDICT_PRIORITY = {'抄襲': 0, '無效提交': 1, '未抄襲': 2}
+
+# Top-percent metric names in the table description and source column header
+_METRIC_NAMES = {
+    "token_seq": "Token Sequence",
+    "levenshtein": "Levenshtein",
+    "avg_score": "平均分數"
+}
+_SRC_HEADERS = {
+    "token_seq": "Source (Token Seq)",
+    "levenshtein": "Source (Levenshtein)",
+    "avg_score": "Source (Avg)"
+}
+
+# Comment stripping for the comparison view. Line comments end at any
+# JavaScript line terminator and lines are trimmed with String.trim()'s
+# whitespace set, so the result is what the in-page stripping produced
+_LINE_COMMENT_RE = re.compile(r'(?:;|//)[^\n\r\u2028\u2029]*')
+_BLOCK_COMMENT_RE = re.compile(r'/\*[\s\S]*?\*/')
+_JS_TRIM_CHARS = ('\t\n\v\f\r \xa0\u1680\u2000\u2001\u2002\u2003\u2004\u2005\u2006'
+                  '\u2007\u2008\u2009\u200a\u2028\u2029\u202f\u205f\u3000\ufeff')
+
+def _remove_comments(code):
+    """
+    Drops ';', '//' and '/* */' comments, then blank lines and surrounding
+    whitespace, from source shown side by side in the comparison modal.
+    """
+    code = _LINE_COMMENT_RE.sub('', code)
+    code = _BLOCK_COMMENT_RE.sub('', code)
+    lines = (line.strip(_JS_TRIM_CHARS) for line in code.split('\n'))
+    return '\n'.join(line for line in lines if line)
+
+def _dumps(obj):
+    """
+    Compact JSON text with non-ASCII kept as is; uses orjson when installed.
+    """
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY).decode('utf-8')
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':'))
+
+def _script_json(obj):
+    """
+    JSON text safe to embed in a <script> element. Every '<' is written as
+    \\u003c so neither '</script>' nor '<!--' in student code can end or
+    alter the script block; JSON.parse turns it back into '<'.
     """
+    return _dumps(obj).replace('<', '\\u003c')
+
+@functools.lru_cache(maxsize=1)
+def _ensure_reports_dir():
+    """
+    Creates the reports directory; only the first report of a run needs to.
+    """
+    os.makedirs(_REPORTS_DIR, exist_ok=True)
+
+def generate_html_report(results, hex_threshold, src_threshold, illegal_students=[], anomaly_students=[], lab_name="Lab", 
+                        filter_mode="threshold", top_metric="max_score", top_percent=0.05, use_keil_compilation=False,
+                        gzip_report=False):
+    """
+    Generates an HTML report from the plagiarism results.
+    If gzip_report is set, a gzip-compressed copy is written next to it as .html.gz.
+    """
+    _ensure_reports_dir()
+    output_file = os.path.join(_REPORTS_DIR, f"{lab_name.replace(' ', '')}_plagiarism_report.html")
     
-    with open(output_file, 'w', encoding='utf-8') as f:
-        f.write(html_content)
+    # Format filter description
+    if filter_mode == "threshold":
+        filter_desc = f"Threshold Mode (Hex > {hex_threshold}, Source > {src_threshold})"
+    else:
+        filter_desc = f"Top Percent Mode (Top {top_percent*100}% by {top_metric})"
+
+    # Fragments are streamed to a temporary file as they are produced, so the
+    # whole report is never held in memory; it replaces an existing report
+    # only once it is complete
+    report_args = (results, hex_threshold, src_threshold, illegal_students, anomaly_students,
+                   lab_name, filter_mode, top_metric, top_percent, filter_desc)
+    tmp_file = f"{output_file}.tmp"
+    gz_file = f"{output_file}.gz"
+    gz_tmp_file = f"{gz_file}.tmp"
+    with open(tmp_file, 'w', encoding='utf-8', buffering=1 << 20) as f:
+        if gzip_report:
+            # Same fragments teed into the compressed copy; level 1 keeps
+            # compression from becoming the bottleneck
+            with gzip.open(gz_tmp_file, 'wt', encoding='utf-8', compresslevel=1) as gz:
+                def emit(text):
+                    f.write(text)
+                    gz.write(text)
+                _write_report(emit, *report_args)
+        else:
+            _write_report(f.write, *report_args)
+    os.replace(tmp_file, output_file)
     print(f"Report generated: {output_file}")
+    if gzip_report:
+        os.replace(gz_tmp_file, gz_file)
+        print(f"Compressed report: {gz_file}")
+
+def _write_report(emit, results, hex_threshold, src_threshold, illegal_students, anomaly_students,
+                  lab_name, filter_mode, top_metric, top_percent, filter_desc):
+    """
+    Writes the report HTML through emit, one fragment at a time.
+    """
+    emit(_REPORT_HEAD.format(lab_name=lab_name, total_pairs=len(results), filter_desc=filter_desc))
+    
+    # Add explanation section
+    emit(_EXPLANATION_HTML)
+    
+    # Add anomaly section - between plagiarism and illegal submissions
+    if anomaly_students:
+        emit(f"""
+            <div class="anomaly-section">
+                <h3 class="anomaly-header">⚠️ 檔案異常警告 ({len(anomaly_students)} 位學生)</h3>
+                <p>以下學生的檔案存在異常，但仍參與抄襲比對分析。點擊「查看詳情」可檢視原始碼和 Hex 檔案。</p>
+                <table style="width: 100%; margin-top: 10px;">
+                    <thead>
+                        <tr style="background: #f39c12;">
+                            <th>Student</th>
+                            <th>異常類型</th>
+                            <th>詳細說明</th>
+                            <th>操作</th>
+                        </tr>
+                    </thead>
+                    <tbody>
+        """)
+        # Modal data for every listed student, embedded as one JSON payload
+        anomaly_data = []
+        for student in anomaly_students:
+            # Determine anomaly types
+            anomaly_types = []
+            if student['hex_anomalies']:
+                anomaly_types.append('Hex 檔案')
+            if student['source_anomalies']:
+                anomaly_types.append('原始碼')
+            
+            # Get summary of anomalies
+            anomaly_summary = []
+            for anom in student['hex_anomalies'][:2]:  # First 2 hex anomalies
+                anomaly_summary.append(anom['message'])
+            for anom in student['source_anomalies'][:2]:  # First 2 source anomalies
+                anomaly_summary.append(anom['message'])
+            
+            summary_text = '、'.join(anomaly_summary)
+            if len(student['hex_anomalies']) + len(student['source_anomalies']) > 4:
+                summary_text += '...'
+            
+            emit(f"""
+                        <tr>
+                            <td><strong>{html.escape(student['student'])}</strong></td>
+                            <td>{' + '.join(anomaly_types)}</td>
+                            <td>{html.escape(summary_text)}</td>
+                            <td><button class="view-btn" onclick="openAnomalyModal({len(anomaly_data)})">查看詳情</button></td>
+                        </tr>
+            """)
+            anomaly_data.append({
+                'student': student['student'],
+                'src': student.get('original_source', ''),
+                'hex': student.get('hex', ''),
+                'anomalies': student['hex_anomalies'] + student['source_anomalies'],
+            })
+        emit("""
+                    </tbody>
+                </table>
+            </div>
+        """)
+        emit('    <script id="anomaly-data" type="application/json">')
+        emit(_script_json(anomaly_data))
+        emit('</script>\n')
+    
+    # Add Illegal Submissions Section FIRST
+    if illegal_students:
+        emit(f"""
+            <div class="illegal-section" style="margin: 20px 0; padding: 15px; background: #fff3cd; border-left: 4px solid #f39c12; border-radius: 4px;">
+                <h3 style="margin-top: 0; color: #e67e22;">⚠️ 無效提交名單 ({len(illegal_students)} 位學生)</h3>
+                <p>以下學生提交的檔案不符合規定格式（需包含 .c 或 .a51 原始碼，且必須包含 .hex 檔案）。</p>
+                <table style="width: 100%; margin-top: 10px;">
+                    <thead>
+                        <tr style="background: #f39c12;">
+                            <th>Student</th>
+                            <th>Reason</th>
+                        </tr>
+                    </thead>
+                    <tbody>
+        """)
+        for student in illegal_students:
+            emit(f"""
+                        <tr>
+                            <td><strong>{html.escape(student['student'])}</strong></td>
+                            <td>{html.escape(student['reason'])}</td>
+                        </tr>
+            """)
+        emit("""
+                    </tbody>
+                </table>
+            </div>
+        """)
+    
+    # Group results by verdict priority: 抄襲 > 非法提交 > 未抄襲 > others,
+    # keeping the score order within each group, and collect the plagiarized
+    # students in the same pass
+    buckets = ([], [], [], [])
+    plagiarized_students = set()
+    for res in results:
+        priority = _VERDICT_PRIORITY.get(res.get('final_verdict'), 3)
+        buckets[priority].append(res)
+        if priority == 0:
+            plagiarized_students.add(res['student1'])
+            plagiarized_students.add(res['student2'])
+    sorted_results = buckets[0] + buckets[1] + buckets[2] + buckets[3]
+    
+    # Add plagiarism summary section - only student names
+    if plagiarized_students:
+        emit(f"""
+            <div style="margin: 20px 0; padding: 15px; background: #ffebee; border-left: 4px solid #e74c3c; border-radius: 4px;">
+                <h3 style="margin-top: 0; color: #c0392b;">🚨 抄襲判定名單 ({len(plagiarized_students)} 位學生)</h3>
+                <ul style="columns: 3; -webkit-columns: 3; -moz-columns: 3; list-style-type: disc; padding-left: 20px;">
+        """)
+        for student in sorted(plagiarized_students):
+            emit(f"""
+                    <li><strong>{html.escape(student)}</strong></li>
+            """)
+        emit("""
+                </ul>
+            </div>
+        """)
+    
+    
+    # Generate description text based on filter mode
+    if filter_mode == "threshold":
+        description_text = f"Hex 任一相似度分數 >= {hex_threshold} 或 原始碼平均相似度分數 >= {src_threshold}"
+    else:  # top_percent
+        metric_display = _METRIC_NAMES.get(top_metric, top_metric)
+        description_text = f"依據 {metric_display} 排序，取前 {top_percent*100}% 的配對組合"
+    
+    emit(f"""
+            <h2 style="margin-top: 30px;">詳細比對列表 ({len(sorted_results)} 組)</h2>
+            <p style="color: #666;">{description_text}</p>
+    """)
+    
+    # Determine table headers based on filter mode
+    hex_header = "Hex Score"  # Always use "Hex Score" for consistency
+    src_header = "Source (Avg)"  # Default to average
+    
+    if filter_mode == "top_percent":
+        src_header = _SRC_HEADERS.get(top_metric, src_header)
+    # In threshold mode, keep "Source (Avg)" as default
+            
+    emit(f"""
+            <table>
+                <thead>
+                    <tr>
+                        <th>Rank</th>
+                        <th>Student 1</th>
+                        <th>Student 2</th>
+                        <th>{hex_header}</th>
+                        <th>{src_header}</th>
+                        <th>最終判定</th>
+                        <th>Details</th>
+                    </tr>
+                </thead>
+                <tbody>
+    """)
+    
+    
+    # Modal data goes into one JSON payload after the table instead of a
+    # hidden div per row. A student's source and hex appear in every pair
+    # they are part of, so each distinct text is stored once in blobs and
+    # pairs refer to it by index.
+    pairs = []
+    blobs = []
+    blob_ids = {}
+    def blob_ref(text):
+        blob_id = blob_ids.get(text)
+        if blob_id is None:
+            blob_id = blob_ids[text] = len(blobs)
+            blobs.append(text)
+        return blob_id
+    
+    # Sources are shown without comments; strip each distinct one once
+    code_ids = {}
+    def code_ref(text):
+        blob_id = code_ids.get(text)
+        if blob_id is None:
+            blob_id = code_ids[text] = blob_ref(_remove_comments(text))
+        return blob_id
+    
+    # Bound once as locals; the loop runs once per reported pair
+    escape = html.escape
+    add_pair = pairs.append
+    
+    # Each student appears in many pairs, so names are escaped once each
+    names = {name for res in sorted_results for name in (res['student1'], res['student2'])}
+    escaped_names = {name: escape(name) for name in names}
+    
+    for i, res in enumerate(sorted_results):
+        get = res.get
+        src_sim = res['source_similarity']
+        hex_comp = res['max_hex_sim']
+        src_comp = res['avg_score'] # Default to average score
+        
+        # Override displayed scores if in top_percent mode with specific metric
+        if filter_mode == "top_percent":
+            if top_metric == "token_seq":
+                src_comp = src_sim['token_seq']
+                hex_comp = res['hex_levenshtein']
+            elif top_metric == "levenshtein":
+                src_comp = src_sim['levenshtein']
+                hex_comp = res['hex_levenshtein']
+            elif top_metric == "avg_score":
+                src_comp = res['avg_score']
+                hex_comp = res['hex_levenshtein']
+        verdict = get('final_verdict', '未知')
+        
+        # Color coding for verdict
+        verdict_html = _VERDICT_HTML.get(verdict, _VERDICT_HTML_UNKNOWN)
+        
+        s1 = escaped_names[res['student1']]
+        s2 = escaped_names[res['student2']]
+        
+        # Use original source if available, else cleaned
+        code1_content = get('original_source1') or get('source_code1', 'Source not available')
+        code2_content = get('original_source2') or get('source_code2', 'Source not available')
+        
+        llm_analysis = get('llm_analysis') or {}
+        
+        add_pair({
+            's1': res['student1'],
+            's2': res['student2'],
+            'code1': code_ref(code1_content),
+            'code2': code_ref(code2_content),
+            'hex1': blob_ref(get('hex_code1', 'Hex not available')),
+            'hex2': blob_ref(get('hex_code2', 'Hex not available')),
+            'llm_reasoning': llm_analysis.get('reasoning', ''),
+            'verdict_reason': get('verdict_reason', ''),
+            'ill1': bool(get('illegal_submission1')),
+            'reason1': get('illegal_reason1', ''),
+            'ill2': bool(get('illegal_submission2')),
+            'reason2': get('illegal_reason2', ''),
+            # Chart data - restructured format
+            'chart': {
+                'token_seq': [src_sim['token_seq'], 0],
+                'levenshtein': [src_sim['levenshtein'], res['hex_levenshtein']]
+            },
+        })
+        
+        # Format scores with bold based on filter mode
+        if filter_mode == "threshold":
+            # Threshold mode: bold if exceeding threshold
+            hex_display = f"<strong>{hex_comp:.2f}</strong>" if hex_comp > hex_threshold else f"{hex_comp:.2f}"
+            src_display = f"<strong>{src_comp:.2f}</strong>" if src_comp > src_threshold else f"{src_comp:.2f}"
+        else:  # top_percent mode
+            # Top percent mode: ALL results are already the top N% selected by main.py
+            # So we bold all source scores (since they were selected based on source metrics)
+            # Hex is never bolded because selection is not based on hex
+            hex_display = f"{hex_comp:.2f}"  # Never bold hex in top_percent mode
+            src_display = f"<strong>{src_comp:.2f}</strong>"  # All source scores are bold
+        
+        row = f"""
+            <tr onclick="openModal('{i}')">
+                <td>{i+1}</td>
+                <td>{s1}</td>
+                <td>{s2}</td>
+                <td>{hex_display}</td>
+                <td>{src_display}</td>
+                <td>{verdict_html}</td>
+                <td><button>View</button></td>
+            </tr>
+        """
+        emit(row)
+
+    emit("""
+                </tbody>
+            </table>
+    """)
+
+    emit('\n    <script id="pairs" type="application/json">')
+    emit(_script_json(pairs))
+    emit('</script>\n    <script id="blobs" type="application/json">[')
+    # One blob at a time so the whole payload is never held as one string
+    for blob_id, text in enumerate(blobs):
+        if blob_id:
+            emit(',')
+        emit(_script_json(text))
+    emit(']</script>\n')
+
+    emit(_REPORT_TAIL)
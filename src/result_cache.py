@@ -0,0 +1,80 @@
+"""On-disk cache of per-student preprocessing and pairwise similarity results."""
+import hashlib
+import os
+import shelve
+
+# Bump when cached data would no longer match what the current code produces
+CACHE_VERSION = 3
+
+
+def content_hash(*parts):
+    """
+    SHA-1 of the given str/bytes parts, separated so ("ab", "c") != ("a", "bc").
+    """
+    h = hashlib.sha1()
+    for part in parts:
+        if isinstance(part, str):
+            part = part.encode('utf-8')
+        h.update(len(part).to_bytes(8, 'little'))
+        h.update(part)
+    return h.hexdigest()
+
+
+def files_hash(file_paths, *extra):
+    """
+    Hash of a set of files (names and bytes) plus any extra settings that
+    change how they are processed. Returns None if a file cannot be read.
+    """
+    parts = [str(part) for part in extra]
+    try:
+        for path in sorted(file_paths):
+            with open(path, 'rb') as f:
+                parts.append(path)
+                parts.append(f.read())
+    except OSError:
+        return None
+    return content_hash(*parts)
+
+
+class ResultCache:
+    """
+    Persistent key-value store for results that only depend on file content.
+
+    Student entries are keyed by the hash of the student's files; score rows
+    by the content hash of the compared text, so they survive renames and
+    reruns. A row maps the hashes of the other texts to their scores, and is
+    stored per score cutoff since scores below it are recorded as 0.0.
+    Only the process that owns the cache should read or write it.
+    """
+
+    def __init__(self, cache_dir):
+        os.makedirs(cache_dir, exist_ok=True)
+        self._db = shelve.open(os.path.join(cache_dir, f'results_v{CACHE_VERSION}'))
+
+    def get_student(self, key):
+        if key is None:
+            return None
+        return self._db.get(f'student:{key}')
+
+    def put_student(self, key, data):
+        if key is not None:
+            self._db[f'student:{key}'] = data
+
+    @staticmethod
+    def _row_key(metric, score_cutoff, text_hash):
+        return f'row:{metric}:{score_cutoff}:{text_hash}'
+
+    def get_row(self, metric, score_cutoff, text_hash):
+        return self._db.get(self._row_key(metric, score_cutoff, text_hash))
+
+    def put_row(self, metric, score_cutoff, text_hash, scores):
+        self._db[self._row_key(metric, score_cutoff, text_hash)] = scores
+
+    def close(self):
+        self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
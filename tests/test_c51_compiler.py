@@ -15,13 +15,21 @@ from c51_compiler import (
     find_keil_c51,
     extract_code_from_listing,
     compile_c_to_asm_keil,
-    compile_and_extract_asm
+    compile_and_extract_asm,
+    compile_many
 )
 
 
 class TestFindKeilC51(unittest.TestCase):
     """Test Keil C51 path detection"""
     
+    def setUp(self):
+        # Lookup result is cached across calls
+        find_keil_c51.cache_clear()
+        
+    def tearDown(self):
+        find_keil_c51.cache_clear()
+        
     @patch('os.path.exists')
     def test_find_common_path(self, mock_exists):
         # Mock that C:\Keil_v5\C51 exists
@@ -102,6 +110,16 @@ class TestExtractCodeFromListing(unittest.TestCase):
         # Should not include summary
         self.assertNotIn('SUMMARY', result)
         self.assertNotIn('CODE SIZE', result)
+        
+    def test_operation_anywhere_in_line(self):
+        listing = """
+        12    LCALL delay
+        13    P1 = x; /* ret */
+        14    P2 = 0;
+        """
+        result = extract_code_from_listing(listing)
+        # Lines mentioning a common operation are kept without their line number
+        self.assertEqual(result.splitlines(), ["LCALL delay", "P1 = x; /* ret */"])
 
 
 class TestCompileCToAsmKeil(unittest.TestCase):
@@ -161,8 +179,8 @@ class TestCompileCToAsmKeil(unittest.TestCase):
         # Mock failed compilation
         mock_result = MagicMock()
         mock_result.returncode = 1
-        mock_result.stdout = "Error: syntax error"
-        mock_result.stderr = ""
+        mock_result.stdout = b"Error: syntax error"
+        mock_result.stderr = b""
         mock_run.return_value = mock_result
         
         success, content, error = compile_c_to_asm_keil("test.c")
@@ -218,5 +236,113 @@ class TestCompileAndExtractAsm(unittest.TestCase):
         self.assertEqual(error, "Compilation error")
 
 
+    @staticmethod
+    def _fake_keil(root):
+        """Keil directory layout with an empty C51.exe"""
+        os.makedirs(os.path.join(root, "BIN"))
+        open(os.path.join(root, "BIN", "C51.exe"), 'w').close()
+        return root
+        
+    @patch('c51_compiler.compile_c_to_asm_keil')
+    def test_cache_hit_skips_compilation(self, mock_compile):
+        mock_compile.return_value = (True, "1     0000 7855      MOV A,#55H", "")
+        
+        with tempfile.TemporaryDirectory() as tmp:
+            c_file = os.path.join(tmp, "main.c")
+            with open(c_file, 'w') as f:
+                f.write("void main(void) { P1 = 0x55; }\n")
+            cache_dir = os.path.join(tmp, "cache")
+            keil = self._fake_keil(os.path.join(tmp, "keil"))
+            
+            first = compile_and_extract_asm(c_file, keil_path=keil, cache_dir=cache_dir)
+            second = compile_and_extract_asm(c_file, keil_path=keil, cache_dir=cache_dir)
+            
+            self.assertEqual(mock_compile.call_count, 1)
+            self.assertEqual(first, second)
+            self.assertTrue(first[0])
+            
+            # Another compiler setup must not reuse the entry
+            other_keil = self._fake_keil(os.path.join(tmp, "other_keil"))
+            compile_and_extract_asm(c_file, keil_path=other_keil, cache_dir=cache_dir)
+            self.assertEqual(mock_compile.call_count, 2)
+            
+            # Nor a newer listing extractor
+            with patch('c51_compiler._EXTRACTOR_VERSION', -1):
+                compile_and_extract_asm(c_file, keil_path=keil, cache_dir=cache_dir)
+            self.assertEqual(mock_compile.call_count, 3)
+            
+    @patch('c51_compiler.compile_c_to_asm_keil')
+    def test_cache_needs_installed_compiler(self, mock_compile):
+        mock_compile.return_value = (True, "1     0000 7855      MOV A,#55H", "")
+        
+        with tempfile.TemporaryDirectory() as tmp:
+            c_file = os.path.join(tmp, "main.c")
+            with open(c_file, 'w') as f:
+                f.write("void main(void) { P1 = 0x55; }\n")
+            cache_dir = os.path.join(tmp, "cache")
+            keil = self._fake_keil(os.path.join(tmp, "keil"))
+            compile_and_extract_asm(c_file, keil_path=keil, cache_dir=cache_dir)
+            
+            # Once Keil is uninstalled the compiler's own error is reported
+            os.remove(os.path.join(keil, "BIN", "C51.exe"))
+            mock_compile.return_value = (False, "", "C51 compiler not found")
+            result = compile_and_extract_asm(c_file, keil_path=keil, cache_dir=cache_dir)
+            self.assertEqual(result, (False, "", "C51 compiler not found"))
+            
+    @patch('c51_compiler.compile_c_to_asm_keil')
+    def test_failures_not_cached(self, mock_compile):
+        mock_compile.return_value = (False, "", "Compilation error")
+        
+        with tempfile.TemporaryDirectory() as tmp:
+            c_file = os.path.join(tmp, "main.c")
+            with open(c_file, 'w') as f:
+                f.write("void main(void) {\n")
+            cache_dir = os.path.join(tmp, "cache")
+            
+            compile_and_extract_asm(c_file, keil_path="keil", cache_dir=cache_dir)
+            compile_and_extract_asm(c_file, keil_path="keil", cache_dir=cache_dir)
+            
+            self.assertEqual(mock_compile.call_count, 2)
+
+
+class TestCompileMany(unittest.TestCase):
+    """Test compiling several C files with one Keil lookup"""
+    
+    def test_empty_list(self):
+        self.assertEqual(compile_many([]), [])
+        
+    @patch('c51_compiler.find_keil_c51')
+    def test_keil_not_found(self, mock_find):
+        mock_find.return_value = None
+        
+        results = compile_many(["a.c", "b.c"])
+        
+        self.assertEqual(len(results), 2)
+        for success, asm_code, error in results:
+            self.assertFalse(success)
+            self.assertIn("not found", error)
+            
+    @patch('c51_compiler.compile_c_to_asm_keil')
+    @patch('c51_compiler.find_keil_c51')
+    def test_shared_output_dir(self, mock_find, mock_compile):
+        mock_find.return_value = r"C:\Keil_v5\C51"
+        mock_compile.side_effect = [
+            (True, "1     0000 7855      MOV A,#55H", ""),
+            (False, "", "Compilation failed"),
+        ]
+        
+        results = compile_many(["a.c", "b.c"])
+        
+        self.assertEqual(mock_find.call_count, 1)
+        output_dirs = {call.kwargs['output_dir'] for call in mock_compile.call_args_list}
+        self.assertEqual(len(output_dirs), 1)
+        # Shared output directory is cleaned up
+        self.assertFalse(os.path.exists(output_dirs.pop()))
+        
+        self.assertTrue(results[0][0])
+        self.assertIn("MOV", results[0][1])
+        self.assertEqual(results[1], (False, "", "Compilation failed"))
+
+
 if __name__ == '__main__':
     unittest.main(verbosity=2)
@@ -5,16 +5,22 @@ Tests Token Sequence Similarity (LCS) and Levenshtein Distance algorithms
 import unittest
 import sys
 import os
+from unittest.mock import patch
 
 # Add src to path
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
 
+import detector
 from detector import (
     tokenize_code,
+    tokenize_to_ids,
     lcs_length,
+    lcs_bitparallel,
     calculate_token_sequence_similarity,
     calculate_levenshtein_similarity,
-    calculate_combined_similarity
+    calculate_combined_similarity,
+    pairwise_token_sequence_similarity,
+    pairwise_levenshtein_similarity
 )
 
 
@@ -31,6 +37,14 @@ class TestTokenizeCode(unittest.TestCase):
     def test_multiple_spaces(self):
         result = tokenize_code("mov   a,    #55h")
         self.assertEqual(result, ["mov", "a,", "#55h"])
+        
+    def test_token_ids_share_vocab(self):
+        vocab = {}
+        ids1 = tokenize_to_ids("mov a, #55h", vocab)
+        ids2 = tokenize_to_ids("mov r0, #55h", vocab)
+        self.assertEqual(ids1, [0, 1, 2])
+        self.assertEqual(ids2, [0, 3, 2])
+        self.assertEqual(len(vocab), 4)
 
 
 class TestLCSLength(unittest.TestCase):
@@ -57,6 +71,36 @@ class TestLCSLength(unittest.TestCase):
         result = lcs_length(seq1, seq2)
         self.assertGreater(result, 0)
         self.assertLess(result, 6)
+        
+    def test_exact_length(self):
+        seq1 = ["mov", "a", "#55h", "add", "a", "r0"]
+        seq2 = ["mov", "a", "#85", "add", "a", "r1"]
+        # Common: mov, a, add, a
+        self.assertEqual(lcs_length(seq1, seq2), 4)
+        
+    def test_non_contiguous_subsequence(self):
+        seq1 = ["a", "b", "c", "d", "e"]
+        seq2 = ["a", "x", "c", "y", "e"]
+        self.assertEqual(lcs_length(seq1, seq2), 3)
+
+
+class TestLCSBitParallel(unittest.TestCase):
+    """Test the pure Python bit-parallel LCS fallback"""
+    
+    def test_empty_sequences(self):
+        self.assertEqual(lcs_bitparallel([], ["a"]), 0)
+        self.assertEqual(lcs_bitparallel(["a"], []), 0)
+        
+    def test_matches_lcs_length(self):
+        cases = [
+            (["a", "b", "c", "d"], ["a", "c", "d"]),
+            (["mov", "add", "sub", "jmp"], ["mov", "sub", "jmp", "ret"]),
+            (["a", "b", "a", "b", "a"], ["b", "a", "b"]),
+            (["x"] * 100, ["x", "y"] * 70),
+        ]
+        for tokens1, tokens2 in cases:
+            self.assertEqual(lcs_bitparallel(tokens1, tokens2), lcs_length(tokens1, tokens2))
+            self.assertEqual(lcs_bitparallel(tokens2, tokens1), lcs_length(tokens1, tokens2))
 
 
 class TestTokenSequenceSimilarity(unittest.TestCase):
@@ -94,6 +138,13 @@ class TestTokenSequenceSimilarity(unittest.TestCase):
         similarity = calculate_token_sequence_similarity(code1, code2)
         # LCS should still find common tokens (adjusted expectation)
         self.assertGreater(similarity, 0.5)
+        
+    def test_lcs_ratio_formula(self):
+        code1 = "mov a, #55h add a, r0"
+        code2 = "mov a, #85 add a, r1"
+        # 2 * LCS / (len1 + len2) = 2 * 4 / (6 + 6)
+        similarity = calculate_token_sequence_similarity(code1, code2)
+        self.assertAlmostEqual(similarity, 8 / 12)
 
 
 class TestLevenshteinSimilarity(unittest.TestCase):
@@ -122,6 +173,13 @@ class TestLevenshteinSimilarity(unittest.TestCase):
         similarity = calculate_levenshtein_similarity(text1, text2)
         self.assertEqual(similarity, 0.0)
         
+    def test_score_cutoff(self):
+        text1 = "mov a, #55h"
+        text2 = "clr c"
+        exact = calculate_levenshtein_similarity(text1, text2)
+        self.assertEqual(calculate_levenshtein_similarity(text1, text2, score_cutoff=exact + 0.01), 0.0)
+        self.assertAlmostEqual(calculate_levenshtein_similarity(text1, text2, score_cutoff=exact), exact)
+        
     def test_case_sensitive(self):
         text1 = "MOV A"
         text2 = "mov a"
@@ -163,6 +221,105 @@ class TestCombinedSimilarity(unittest.TestCase):
         self.assertGreater(result['levenshtein'], 0.6)
 
 
+class TestPairwiseSimilarity(unittest.TestCase):
+    """Test all-pairs similarity matrices"""
+    
+    CODES = [
+        "mov a, #55h add a, r0",
+        "mov a, #85 add a, r1",
+        "clr r0 ret",
+        "mov a, #55h cpl p1 sjmp loop",
+    ]
+    
+    def test_matrix_shape(self):
+        matrix = pairwise_token_sequence_similarity(self.CODES)
+        self.assertEqual(matrix.shape, (4, 4))
+        
+    def test_token_seq_matches_pairwise_function(self):
+        matrix = pairwise_token_sequence_similarity(self.CODES)
+        for i, code1 in enumerate(self.CODES):
+            for j, code2 in enumerate(self.CODES):
+                self.assertAlmostEqual(matrix[i][j], calculate_token_sequence_similarity(code1, code2))
+                
+    def test_levenshtein_matches_pairwise_function(self):
+        matrix = pairwise_levenshtein_similarity(self.CODES)
+        for i, code1 in enumerate(self.CODES):
+            for j, code2 in enumerate(self.CODES):
+                self.assertAlmostEqual(matrix[i][j], calculate_levenshtein_similarity(code1, code2))
+                
+    def test_score_cutoff_zeroes_low_scores(self):
+        matrix = pairwise_token_sequence_similarity(self.CODES, score_cutoff=0.5)
+        # "clr r0 ret" shares no tokens with the first code
+        self.assertEqual(matrix[0][2], 0.0)
+        # Scores at or above the cutoff are exact
+        self.assertAlmostEqual(matrix[0][1], calculate_token_sequence_similarity(self.CODES[0], self.CODES[1]))
+        
+    def test_rows_subset(self):
+        full = pairwise_token_sequence_similarity(self.CODES)
+        rows = pairwise_token_sequence_similarity(self.CODES, rows=[2, 0])
+        self.assertEqual(rows.shape, (2, 4))
+        for k, i in enumerate([2, 0]):
+            for j in range(4):
+                self.assertAlmostEqual(rows[k, j], full[i, j])
+
+    def test_rows_only_score_requested_texts(self):
+        codes = self.CODES + [self.CODES[2]]
+        with patch('detector.process.cdist', wraps=detector.process.cdist) as cdist:
+            token_rows = pairwise_token_sequence_similarity(codes, rows=[4, 2, 1])
+            lev_rows = pairwise_levenshtein_similarity(codes, rows=[4, 2, 1])
+        # Rows 4 and 2 hold the same text, so only two queries are scored
+        for call in cdist.call_args_list:
+            self.assertEqual(len(call.args[0]), 2)
+        for k, i in enumerate([4, 2, 1]):
+            for j, code in enumerate(codes):
+                self.assertAlmostEqual(token_rows[k, j], calculate_token_sequence_similarity(codes[i], code))
+                self.assertAlmostEqual(lev_rows[k, j], calculate_levenshtein_similarity(codes[i], code))
+
+        with patch('detector.process', None), \
+             patch('detector.calculate_levenshtein_similarity',
+                   wraps=calculate_levenshtein_similarity) as scorer:
+            pairwise_levenshtein_similarity(codes, rows=[1])
+        self.assertEqual({call.args[0] for call in scorer.call_args_list}, {codes[1]})
+
+    def test_duplicate_texts(self):
+        codes = self.CODES + [self.CODES[0], ""]
+        token_matrix = pairwise_token_sequence_similarity(codes)
+        lev_matrix = pairwise_levenshtein_similarity(codes)
+        self.assertEqual(token_matrix.shape, (6, 6))
+        for i, code1 in enumerate(codes[:5]):
+            for j, code2 in enumerate(codes[:5]):
+                self.assertAlmostEqual(token_matrix[i, j], calculate_token_sequence_similarity(code1, code2))
+                self.assertAlmostEqual(lev_matrix[i, j], calculate_levenshtein_similarity(code1, code2))
+        
+    def test_fallback_without_rapidfuzz(self):
+        expected_token = pairwise_token_sequence_similarity(self.CODES)
+        expected_lev = pairwise_levenshtein_similarity(self.CODES)
+        
+        with patch('detector.process', None), patch('detector.Indel', None), patch('detector.LCSseq', None):
+            token_matrix = pairwise_token_sequence_similarity(self.CODES)
+            lev_matrix = pairwise_levenshtein_similarity(self.CODES)
+            
+        for i in range(len(self.CODES)):
+            for j in range(len(self.CODES)):
+                self.assertAlmostEqual(token_matrix[i, j], expected_token[i, j])
+                self.assertAlmostEqual(lev_matrix[i, j], expected_lev[i, j])
+
+    def test_fallback_score_cutoff_matches_rapidfuzz(self):
+        codes = self.CODES + ["mov a, #55h add a, r0 " * 10, ""]
+        for cutoff in (0.3, 0.5, 0.8):
+            expected_token = pairwise_token_sequence_similarity(codes, score_cutoff=cutoff)
+            expected_lev = pairwise_levenshtein_similarity(codes, score_cutoff=cutoff)
+            
+            with patch('detector.process', None), patch('detector.Indel', None), patch('detector.LCSseq', None):
+                token_matrix = pairwise_token_sequence_similarity(codes, score_cutoff=cutoff)
+                lev_matrix = pairwise_levenshtein_similarity(codes, score_cutoff=cutoff)
+                
+            for i in range(len(codes)):
+                for j in range(len(codes)):
+                    self.assertAlmostEqual(token_matrix[i, j], expected_token[i, j])
+                    self.assertAlmostEqual(lev_matrix[i, j], expected_lev[i, j])
+
+
 class TestEdgeCases(unittest.TestCase):
     """Test edge cases and boundary conditions"""
     
@@ -12,6 +12,7 @@ import shutil
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
 
 from preprocessor import (
+    crawl_directory,
     clean_code,
     normalize_hex,
     validate_source_code,
@@ -19,6 +20,45 @@ from preprocessor import (
 )
 
 
+class TestCrawlDirectory(unittest.TestCase):
+    """Test student folder discovery"""
+    
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+        
+    def _touch(self, *parts):
+        path = os.path.join(self.temp_dir, *parts)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        open(path, 'w').close()
+        return path
+        
+    def test_files_grouped_by_top_level_folder(self):
+        main = self._touch('s1', 'main.A51')
+        nested = self._touch('s1', 'lab', 'out', 'main.hex')
+        notes = self._touch('s1', 'notes.txt')
+        hex_file = self._touch('s2', 'lab.hex')
+        self._touch('stray.c')  # Not inside a student folder
+        
+        student_files = crawl_directory(self.temp_dir)
+        
+        self.assertEqual(set(student_files), {'s1', 's2'})
+        self.assertEqual(student_files['s1']['source'], [main])
+        self.assertEqual(student_files['s1']['hex'], [nested])
+        self.assertEqual(set(student_files['s1']['all_files']), {main, nested, notes})
+        self.assertEqual(student_files['s2']['hex'], [hex_file])
+        
+    def test_empty_student_folder(self):
+        os.makedirs(os.path.join(self.temp_dir, 'empty'))
+        student_files = crawl_directory(self.temp_dir)
+        self.assertEqual(student_files, {'empty': {'source': [], 'hex': [], 'all_files': []}})
+        
+    def test_missing_root(self):
+        self.assertEqual(crawl_directory(os.path.join(self.temp_dir, 'missing')), {})
+
+
 class TestCleanCode(unittest.TestCase):
     """Test code cleaning functionality"""
     
@@ -51,6 +91,15 @@ class TestCleanCode(unittest.TestCase):
         cleaned = clean_code("", '.a51')
         self.assertEqual(cleaned, "")
         
+    def test_repeated_content_is_cached(self):
+        code = "mov a, #55h ; starter code\nadd a, r0"
+        first = clean_code(code, '.a51')
+        hits = clean_code.cache_info().hits
+        self.assertEqual(clean_code(code, '.a51'), first)
+        self.assertEqual(clean_code.cache_info().hits, hits + 1)
+        # The extension is part of the key
+        self.assertIn(';', clean_code(code, '.txt'))
+        
     def test_c_preprocessor_directives(self):
         code = """#include <stdio.h>
         #define MAX 100
@@ -118,6 +167,21 @@ class TestNormalizeHex(unittest.TestCase):
         normalized, info = normalize_hex(hex_data)
         self.assertFalse(info.get('has_eof', True))
         
+    def test_bytes_input_matches_str(self):
+        hex_data = ":03000000020003F8\r\n:0400100012AB34CD0A\r\n:00000001FF\r\n"
+        self.assertEqual(normalize_hex(hex_data.encode('ascii')), normalize_hex(hex_data))
+        
+    def test_mixed_case_fields(self):
+        normalized, info = normalize_hex(":0A0000000102030405060708090A7C\n:0000000aFF")
+        self.assertEqual(normalized, "0102030405060708090a")
+        self.assertEqual(info['valid_lines'], 1)
+        
+    def test_malformed_field_reported(self):
+        normalized, info = normalize_hex(":0G000000020003F8")
+        self.assertEqual(normalized, "")
+        self.assertEqual(info['format_errors'],
+                         ["Line 1: Parse error - invalid literal for int() with base 16: '0G'"])
+        
     def test_case_normalization(self):
         hex_data = ":03000000020003f8\n:00000001ff"  # Lowercase
         normalized, info = normalize_hex(hex_data)
@@ -36,8 +36,8 @@ class TestC51CompilationRegressions(unittest.TestCase):
                 # Simulate C51 error output for encoding issues
                 mock_result = MagicMock()
                 mock_result.returncode = 2
-                mock_result.stdout = "*** ERROR C100: unprintable character 0xFF skipped"
-                mock_result.stderr = ""
+                mock_result.stdout = b"*** ERROR C100: unprintable character 0xFF skipped"
+                mock_result.stderr = b""
                 mock_run.return_value = mock_result
                 
                 with patch('shutil.copy2'), patch('tempfile.mkdtemp') as mock_mkdtemp:
@@ -64,8 +64,8 @@ class TestC51CompilationRegressions(unittest.TestCase):
                 # Simulate missing include file error
                 mock_result = MagicMock()
                 mock_result.returncode = 1
-                mock_result.stdout = "*** ERROR: Cannot open include file 'reg51.h'"
-                mock_result.stderr = ""
+                mock_result.stdout = b"*** ERROR: Cannot open include file 'reg51.h'"
+                mock_result.stderr = b""
                 mock_run.return_value = mock_result
                 
                 with patch('shutil.copy2'), patch('tempfile.mkdtemp') as mock_mkdtemp:
@@ -0,0 +1,90 @@
+"""
+Unit tests for reporter.py
+Tests the JSON payloads embedded in the HTML report
+"""
+import unittest
+import sys
+import os
+import re
+import json
+from unittest.mock import patch
+
+# Add src to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import reporter
+from reporter import _dumps, _write_report
+
+_PAYLOAD_RE = re.compile(r'<script id="([\w-]+)" type="application/json">(.*?)</script>', re.S)
+
+
+def _sample_results():
+    """Two pairs with markup, quotes and non-ASCII text in every field"""
+    code = "; 學生 <b>\nMOV A, #0x55 ; </script> & \"q\"\n"
+    return [
+        {
+            'student1': 's<1>', 'student2': "學生'2",
+            'source_similarity': {'token_seq': 0.8125, 'levenshtein': 0.1 + 0.2},
+            'hex_levenshtein': 1.0, 'max_hex_sim': 1.0, 'avg_score': 0.55625,
+            'final_verdict': '抄襲', 'verdict_reason': 'Hex <100%>',
+            'source_code1': code.lower(), 'source_code2': code.lower(),
+            'original_source1': code, 'original_source2': code,
+            'hex_code1': ':0300000002 <', 'hex_code2': ':0300000002 <',
+            'illegal_submission1': False, 'illegal_submission2': True,
+            'illegal_reason2': '缺少 <hex>',
+        },
+        {
+            'student1': 's<1>', 'student2': 's&3',
+            'source_similarity': {'token_seq': 0, 'levenshtein': 1e-07},
+            'hex_levenshtein': 0, 'max_hex_sim': 0, 'avg_score': 5e-08,
+            'llm_analysis': {'reasoning': 'because <x> & "y"', 'is_plagiarized': False},
+            'source_code1': code, 'source_code2': '',
+            'illegal_submission1': False, 'illegal_submission2': False,
+        },
+    ]
+
+
+def _render_payloads():
+    """Report payload texts by script id"""
+    fragments = []
+    anomalies = [{'student': 's&3', 'original_source': "<!-- x -->", 'hex': '',
+                  'hex_anomalies': [{'code': 'NO_EOF', 'severity': 'warning', 'message': '缺少 <EOF>'}],
+                  'source_anomalies': [{'code': 'FEW', 'severity': 'error', 'message': 'm',
+                                        'details': {'count': 3}}]}]
+    _write_report(fragments.append, _sample_results(), 0.7, 0.8, [], anomalies,
+                  "Lab", "threshold", "avg_score", 0.05, "Threshold Mode")
+    return dict(_PAYLOAD_RE.findall(''.join(fragments)))
+
+
+class TestReportJson(unittest.TestCase):
+    """Test that orjson and the json fallback embed the same payloads"""
+
+    @unittest.skipIf(reporter.orjson is None, "orjson not installed")
+    def test_backends_agree(self):
+        with_orjson = _render_payloads()
+        with patch('reporter.orjson', None):
+            with_json = _render_payloads()
+
+        self.assertEqual(set(with_orjson), {'anomaly-data', 'pairs', 'blobs'})
+        self.assertEqual(set(with_orjson), set(with_json))
+        for script_id, text in with_orjson.items():
+            self.assertEqual(json.loads(text), json.loads(with_json[script_id]), script_id)
+
+    def test_script_payload_escapes_markup(self):
+        for backend in (reporter.orjson, None):
+            with self.subTest(orjson=backend is not None), patch('reporter.orjson', backend):
+                payloads = _render_payloads()
+                for script_id, text in payloads.items():
+                    self.assertNotIn('<', text, script_id)
+                    self.assertIn('\\u003c', text, script_id)
+                blobs = json.loads(payloads['blobs'])
+                self.assertTrue(any('<' in blob for blob in blobs))
+
+    def test_non_ascii_kept(self):
+        with patch('reporter.orjson', None):
+            self.assertEqual(_dumps(['學生', 0.5]), '["學生",0.5]')
+        self.assertEqual(_dumps(['學生', 0.5]), '["學生",0.5]')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+"""
+Unit tests for result_cache.py
+Tests content hashing and the persistent result store
+"""
+import unittest
+import sys
+import os
+import tempfile
+
+# Add src to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from result_cache import content_hash, files_hash, ResultCache
+
+
+class TestContentHash(unittest.TestCase):
+    """Test content hashing"""
+    
+    def test_str_and_bytes_equal(self):
+        self.assertEqual(content_hash("mov a, #55h"), content_hash(b"mov a, #55h"))
+        
+    def test_parts_are_separated(self):
+        self.assertNotEqual(content_hash("ab", "c"), content_hash("a", "bc"))
+        
+    def test_files_hash_tracks_content(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "main.a51")
+            with open(path, 'w') as f:
+                f.write("mov a, #55h\n")
+            first = files_hash([path])
+            self.assertEqual(first, files_hash([path]))
+            # Settings that change processing change the hash
+            self.assertNotEqual(first, files_hash([path], True))
+            
+            with open(path, 'w') as f:
+                f.write("mov a, #56h\n")
+            self.assertNotEqual(first, files_hash([path]))
+            
+    def test_files_hash_missing_file(self):
+        self.assertIsNone(files_hash(["does_not_exist.a51"]))
+
+
+class TestResultCache(unittest.TestCase):
+    """Test the persistent result store"""
+    
+    def test_rows_are_keyed_by_metric_and_cutoff(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            with ResultCache(tmp) as cache:
+                cache.put_row('token_seq', None, 'aaa', {'aaa': 1.0, 'bbb': 0.5})
+                self.assertEqual(cache.get_row('token_seq', None, 'aaa'), {'aaa': 1.0, 'bbb': 0.5})
+                self.assertIsNone(cache.get_row('levenshtein', None, 'aaa'))
+                # Rows scored with a cutoff are not reused without it
+                self.assertIsNone(cache.get_row('token_seq', 0.6, 'aaa'))
+                self.assertIsNone(cache.get_row('token_seq', None, 'bbb'))
+                
+    def test_persists_across_instances(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            with ResultCache(tmp) as cache:
+                cache.put_student('key', {'source': "mov a, #55h"})
+            with ResultCache(tmp) as cache:
+                self.assertEqual(cache.get_student('key'), {'source': "mov a, #55h"})
+                self.assertIsNone(cache.get_student(None))
+
+
+if __name__ == '__main__':
+    unittest.main()